@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+import asyncio
+import ssl
+import threading
+import time
+from collections import defaultdict
+from http.client import parse_headers
+from io import BytesIO
+from typing import Any, Callable, Coroutine
+from urllib.parse import urlsplit
+
+import transport
+from convas_requests import (
+    Page,
+    Validators,
+    Walk,
+    conditional_headers,
+    parse_page,
+    walk_paginated,
+)
+from helper import Logger
+from scheduler import TRANSIENT_ERRORS, RequestError, scheduler
+from transport import (
+    ACCEPT_ENCODING,
+    ConnectionPool,
+    Decoder,
+    HostKey,
+    Response,
+    TransferStats,
+    pool,
+)
+
+Stream = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncConnectionPool:
+    """Keep-alive HTTP/1.1 connections over asyncio streams"""
+
+    def __init__(self, stats: TransferStats, timeout: float = 30):
+        self.stats = stats
+        self.timeout = timeout
+        self.idle: dict[HostKey, list[Stream]] = defaultdict(list)
+        self.ssl_context = ssl.create_default_context()
+        self.connections_opened = 0
+
+    async def acquire(self, key: HostKey) -> tuple[Stream, bool]:
+        while self.idle[key]:
+            reader, writer = self.idle[key].pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+        scheme, host, port = key
+        self.connections_opened += 1
+        stream = await asyncio.wait_for(
+            asyncio.open_connection(
+                host,
+                port,
+                ssl=self.ssl_context if scheme == "https" else None,
+            ),
+            self.timeout,
+        )
+        return stream, False
+
+    def release(self, key: HostKey, stream: Stream) -> None:
+        self.idle[key].append(stream)
+
+    def close(self) -> None:
+        for streams in self.idle.values():
+            for _, writer in streams:
+                writer.close()
+        self.idle.clear()
+
+    @staticmethod
+    async def read_body(reader: asyncio.StreamReader, headers: Any) -> bytes:
+        if "chunked" in (headers.get("transfer-encoding") or "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # skip trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+        if headers.get("content-length") is not None:
+            return await reader.readexactly(int(headers["content-length"]))
+        return await reader.read()
+
+    async def exchange(
+        self, stream: Stream, key: HostKey, url: str, headers: dict[str, str]
+    ) -> tuple[Response, bool]:
+        reader, writer = stream
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"GET {path} HTTP/1.1", f"Host: {parts.netloc}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        status = int(status_line.split()[1])
+        header_lines = []
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            header_lines.append(line)
+        message = parse_headers(BytesIO(b"".join(header_lines) + b"\r\n"))
+        raw = b"" if status in (204, 304) else await self.read_body(reader, message)
+
+        decoder = Decoder(message.get("content-encoding"))
+        body = decoder.decode(raw) + decoder.flush()
+        self.stats.add(len(raw), len(body))
+        keep_alive = (
+            message.get("connection", "").lower() != "close"
+            and status_line.startswith(b"HTTP/1.1")
+            and (
+                message.get("content-length") is not None
+                or "chunked" in (message.get("transfer-encoding") or "")
+                or status in (204, 304)
+            )
+        )
+        return Response(url, status, message, body, len(raw)), keep_alive
+
+    async def request(self, url: str, headers: dict[str, str]) -> Response:
+        cassette = transport.cassette
+        if cassette and cassette.mode == "replay":
+            return cassette.play("GET", url, headers)
+        headers = cassette.strip_validators(headers) if cassette else dict(headers)
+        headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+        headers.setdefault("Connection", "keep-alive")
+        key = ConnectionPool.host_key(url)
+        while True:
+            stream, reused = await self.acquire(key)
+            try:
+                response, keep_alive = await asyncio.wait_for(
+                    self.exchange(stream, key, url, headers), self.timeout
+                )
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                stream[1].close()
+                if not reused:
+                    raise ConnectionResetError(str(e))
+                Logger.info(f"Reconnecting to {key[1]}: {e!r}")
+                continue
+            except BaseException:
+                stream[1].close()
+                raise
+            if keep_alive:
+                self.release(key, stream)
+            else:
+                stream[1].close()
+            if cassette:
+                cassette.record("GET", url, None, response)
+            return response
+
+
+class AsyncClient:
+    """Run the install/reload fetch graph as coroutines on one event loop.
+
+    The loop lives in a single background thread for the lifetime of the
+    client so keep-alive connections survive between the courses request
+    and the per course fan out. Requests take their slot under the adaptive
+    limit of the scheduler, shared with the blocking requests, and pages are
+    walked by the same walks as convas_requests. get_paginated_responses has
+    the signature of its blocking counterpart, so it can be handed to the
+    convas_requests helpers as their paginate argument."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.pool = AsyncConnectionPool(pool.stats)
+        self.slot_freed = asyncio.Event()
+        scheduler.add_listener(
+            lambda: self.loop.call_soon_threadsafe(self.slot_freed.set)
+        )
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Block the calling thread until coro has finished on the loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def acquire(self) -> None:
+        """Wait for a slot under the scheduler's limit without blocking the loop"""
+        while True:
+            self.slot_freed.clear()
+            if scheduler.try_acquire():
+                return
+            await self.slot_freed.wait()
+
+    async def request(self, url: str, headers: dict[str, str]) -> Response:
+        """Send a request, retrying throttled and 5xx responses like the
+        blocking scheduler does"""
+        error: Any = None
+        for attempt in range(scheduler.max_retries + 1):
+            if attempt:
+                scheduler.note_retry()
+                await asyncio.sleep(scheduler.backoff(attempt))
+            await self.acquire()
+            started = time.monotonic()
+            try:
+                response = await self.pool.request(url, headers)
+            except (*TRANSIENT_ERRORS, asyncio.IncompleteReadError) as e:
+                error = e
+                Logger.info(f"Retrying {url} after {e!r}")
+                continue
+            finally:
+                scheduler.release()
+            scheduler.note_rtt(time.monotonic() - started)
+            error = scheduler.check(response)
+            if error is None:
+                response.retries = attempt
+                return response
+            Logger.info(f"Retrying {url}: {error}")
+        raise scheduler.give_up(error)
+
+    async def get_page(
+        self, url: str, headers: dict[str, str], validator: dict[str, Any] | None = None
+    ) -> Page | None:
+        response = await self.request(url, conditional_headers(url, headers, validator))
+        return parse_page(url, response, validator)
+
+    async def run_walk(self, walk: Walk, headers: dict[str, str]) -> Any:
+        """Drive walk with coroutines, the requests it asks for together
+        gathered at once"""
+        try:
+            requests = next(walk)
+            while True:
+                try:
+                    pages = await asyncio.gather(
+                        *(
+                            self.get_page(url, headers, validator)
+                            for url, validator in requests
+                        )
+                    )
+                except RequestError as e:
+                    requests = walk.throw(e)
+                else:
+                    requests = walk.send(pages)
+        except StopIteration as done:
+            return done.value
+
+    async def get_paginated_responses(
+        self,
+        url: str,
+        headers: dict[str, str],
+        validators: Validators | None = None,
+        stop_when: Callable[[Any], bool] | None = None,
+    ) -> list[str] | None:
+        return await self.run_walk(walk_paginated(url, validators, stop_when), headers)
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.pool.close)
+
+
+async_client: AsyncClient | None = None
+
+
+def get_async_client() -> AsyncClient:
+    global async_client
+    if async_client is None:
+        async_client = AsyncClient()
+    return async_client
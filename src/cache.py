@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import os
+from typing import Any
+
+from helper import Logger
+from store import CacheStore
+
+STORE_FILES = {"cache.db", "cache.db-wal", "cache.db-shm"}
+
+CATEGORIES = [
+    "store",
+    "other terms",
+    "snapshots",
+    "cold",
+    "downloads",
+    "other",
+]
+# what eviction may remove: nothing the current term needs to render
+EVICTABLE = {"other terms", "cold", "downloads"}
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class CacheEntry:
+    """Files, or the store rows of a course of another term, evicted
+    together. used is the mtime of the most recently written file, or when
+    the course was last synced"""
+
+    def __init__(self, category: str, key: str, course_id: int | None = None):
+        self.category = category
+        self.key = key
+        self.course_id = course_id
+        self.paths: list[str] = []
+        self.size = 0
+        self.used = 0.0
+
+    def add(self, path: str, stat: os.stat_result) -> None:
+        self.paths.append(path)
+        self.size += stat.st_size
+        self.used = max(self.used, stat.st_mtime)
+
+
+class CacheBudget:
+    """Keep <cache_dir> under budget bytes (0 for no limit) by evicting the
+    entries used longest ago: the store rows of courses outside the current
+    term, the keep_full cold objects and downloaded files. The rest of the
+    store and the term snapshots are never evicted."""
+
+    def __init__(self, cache_dir: str, budget: int = 0):
+        self.cache_dir = cache_dir
+        self.budget = budget
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """Mark path as just used"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def scan(
+        self, course_ids: list[Any], store: CacheStore | None = None
+    ) -> list[CacheEntry]:
+        current = {str(id) for id in course_ids}
+        entries: dict[tuple[str, str], CacheEntry] = {}
+
+        def add(category: str, key: str, path: str, course_id: Any = None) -> None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            entry = entries.get((category, key))
+            if entry is None:
+                entry = entries[(category, key)] = CacheEntry(category, key, course_id)
+            entry.add(path, stat)
+
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name in STORE_FILES:
+                add("store", "cache.db", path)
+            elif os.path.isfile(path):
+                add("other", name, path)
+
+        database = entries.get(("store", "cache.db"))
+        if store is not None and database is not None:
+            # rows of other terms count towards their course, not the store
+            for course_id, (size, used) in store.sizes().items():
+                if str(course_id) in current:
+                    continue
+                entry = CacheEntry("other terms", str(course_id), course_id)
+                entry.size, entry.used = size, used
+                entries[("other terms", str(course_id))] = entry
+                database.size = max(database.size - size, 0)
+
+        terms = os.path.join(self.cache_dir, "terms")
+        if os.path.isdir(terms):
+            for name in os.listdir(terms):
+                add("snapshots", name, os.path.join(terms, name))
+
+        cold = os.path.join(self.cache_dir, "cold")
+        if os.path.isdir(cold):
+            for name in os.listdir(cold):
+                add("cold", name, os.path.join(cold, name))
+
+        downloads = os.path.join(self.cache_dir, "downloads")
+        for root, _, names in os.walk(downloads):
+            for name in names:
+                path = os.path.join(root, name)
+                # only the stored contents, not the index that points to them
+                category = "downloads" if root != downloads else "other"
+                add(category, os.path.relpath(path, downloads), path)
+        return list(entries.values())
+
+    def usage(
+        self, course_ids: list[Any], store: CacheStore | None = None
+    ) -> dict[str, tuple[int, int]]:
+        """Number of files and bytes of every category"""
+        usage = {category: (0, 0) for category in CATEGORIES}
+        for entry in self.scan(course_ids, store):
+            files, size = usage[entry.category]
+            usage[entry.category] = (files + len(entry.paths), size + entry.size)
+        return usage
+
+    def evict(
+        self, course_ids: list[Any], store: CacheStore | None = None
+    ) -> tuple[int, int]:
+        """Remove the least recently used evictable entries until the cache
+        fits the budget, returns the number of files and bytes freed"""
+        if not self.budget:
+            return 0, 0
+        entries = self.scan(course_ids, store)
+        total = sum(entry.size for entry in entries)
+        evicted = files = freed = 0
+        forgotten = False
+        evictable = [entry for entry in entries if entry.category in EVICTABLE]
+        for entry in sorted(evictable, key=lambda entry: entry.used):
+            if total - freed <= self.budget:
+                break
+            for path in entry.paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if entry.course_id is not None and store is not None:
+                store.forget(entry.course_id)
+                forgotten = True
+            evicted += 1
+            files += len(entry.paths)
+            freed += entry.size
+        if forgotten and store is not None:
+            store.vacuum()
+        if evicted:
+            Logger.info(
+                f"Evicted {evicted} cache entries ({files} files), {format_size(freed)}"
+            )
+        if total - freed > self.budget:
+            Logger.info(
+                f"Cache is {format_size(total - freed)}, over its budget of "
+                f"{format_size(self.budget)} with nothing left to evict"
+            )
+        return files, freed
+
+    def table(
+        self, course_ids: list[Any], store: CacheStore | None = None
+    ) -> list[str]:
+        """usage() as fixed width text rows, headed by the column names"""
+        usage = self.usage(course_ids, store)
+        lines = [f"{'category':<12} {'files':>6} {'size':>11}  evictable"]
+        for category in CATEGORIES:
+            files, size = usage[category]
+            lines.append(
+                f"{category:<12} {files:>6} {format_size(size):>11}  "
+                f"{'yes' if category in EVICTABLE else 'no'}"
+            )
+        files = sum(files for files, _ in usage.values())
+        size = sum(size for _, size in usage.values())
+        lines.append(f"{'total':<12} {files:>6} {format_size(size):>11}")
+        return lines
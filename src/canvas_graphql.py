@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import json
+import time
+from typing import Any
+
+from helper import Logger
+from scheduler import scheduler
+from stats import RequestRecord, stats
+from transport import pool
+
+ASSIGNMENT_FIELDS = """
+    nodes {
+        _id
+        name
+        htmlUrl
+        pointsPossible
+        createdAt
+        updatedAt
+        dueAt
+        submissionTypes
+    }
+    pageInfo { hasNextPage endCursor }
+"""
+
+
+class GraphQLError(Exception):
+    """Raised when /api/graphql is unavailable or answers with errors"""
+
+
+def build_query(cursors: dict[str, str | None], page_size: int) -> str:
+    """One aliased course(id:) field per course still having pages left"""
+    fields = []
+    for index, (course_id, cursor) in enumerate(cursors.items()):
+        after = f", after: {json.dumps(cursor)}" if cursor else ""
+        fields.append(
+            f"c{index}: course(id: {json.dumps(str(course_id))}) {{"
+            f" assignmentsConnection(first: {page_size}{after}) {{ {ASSIGNMENT_FIELDS} }}"
+            " }"
+        )
+    return "query ConvasSync {\n" + "\n".join(fields) + "\n}"
+
+
+def post_query(url: str, headers: dict[str, str], query: str) -> dict[str, Any]:
+    request_headers = {**headers, "Content-Type": "application/json"}
+    body = json.dumps({"query": query}).encode("utf-8")
+    started = time.perf_counter()
+    response = scheduler.request(
+        lambda: pool.request(url, request_headers, "POST", body=body)
+    )
+    stats.add(
+        RequestRecord(
+            url,
+            time.perf_counter() - started,
+            pages=1,
+            bytes=response.wire_bytes,
+            retries=response.retries,
+            cost=float(response.getheader("x-request-cost") or 0),
+            ok=response.status == 200,
+        )
+    )
+    if response.status != 200:
+        raise GraphQLError(f"graphql returned {response.status}")
+    result = json.loads(response.read().decode("utf-8"))
+    if result.get("errors"):
+        raise GraphQLError(str(result["errors"][0].get("message")))
+    return result["data"]
+
+
+def get_course_assignments(
+    url: str, headers: dict[str, str], course_ids: list[str], page_size: int = 50
+) -> dict[str, list[dict[str, Any]]]:
+    """Assignment nodes of every course in course_ids, one batched query per
+    page instead of one paginated REST walk per course and resource"""
+    nodes: dict[str, list[dict[str, Any]]] = {id: [] for id in course_ids}
+    cursors: dict[str, str | None] = {id: None for id in course_ids}
+    queries = 0
+    while cursors:
+        data = post_query(url, headers, build_query(cursors, page_size))
+        queries += 1
+        next_cursors = {}
+        for index, course_id in enumerate(cursors):
+            course = data.get(f"c{index}")
+            if course is None:
+                raise GraphQLError(f"course {course_id} not found")
+            connection = course["assignmentsConnection"]
+            nodes[course_id].extend(connection["nodes"])
+            if connection["pageInfo"]["hasNextPage"]:
+                next_cursors[course_id] = connection["pageInfo"]["endCursor"]
+        cursors = next_cursors
+    Logger.info(f"Fetched {len(course_ids)} courses in {queries} graphql queries")
+    return nodes
+
+
+def to_assignments(nodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Assignment nodes in the shape of /api/v1/courses/:id/assignments"""
+    return [
+        {
+            "id": int(node["_id"]),
+            "name": node["name"],
+            "html_url": node["htmlUrl"],
+            "points_possible": node["pointsPossible"],
+            "created_at": node["createdAt"],
+            "updated_at": node["updatedAt"],
+            "due_at": node["dueAt"],
+            "submission_types": node["submissionTypes"],
+        }
+        for node in nodes
+    ]
+
+
+def to_quizzes(nodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Quiz assignments in the shape of /api/v1/courses/:id/quizzes. The ids
+    and urls are those of the quiz's assignment, Canvas redirects them to the
+    quiz itself"""
+    return [
+        {
+            "id": int(node["_id"]),
+            "title": node["name"],
+            "html_url": node["htmlUrl"],
+            "due_at": node["dueAt"],
+            "updated_at": node["updatedAt"],
+        }
+        for node in nodes
+        if "online_quiz" in (node["submissionTypes"] or [])
+    ]
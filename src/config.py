@@ -32,6 +32,82 @@ class Config:
     def get_current_term(self) -> str:
         return self.map["term"] if self.map["term"] != "" else ""
 
+    def get_concurrency(self) -> int:
+        """Number of requests the sync engine keeps in flight"""
+        return int(self.map["concurrency"]) if self.map["concurrency"] != "" else 8
+
+    def get_page_concurrency(self) -> int:
+        """Number of pages of a single endpoint fetched at once"""
+        value = self.map["page_concurrency"]
+        return int(value) if value != "" else 4
+
+    def get_backend(self) -> str:
+        """Fetch backend, either thread or async"""
+        return self.map["backend"] if self.map["backend"] != "" else "thread"
+
+    def get_keep_full(self) -> bool:
+        """Keep the full Canvas objects next to the slimmed down cache"""
+        return self.map["keep_full"].lower() in ("true", "yes", "1")
+
+    def get_graphql(self) -> bool:
+        """Fetch assignments and quizzes through the batched graphql endpoint"""
+        return self.map["graphql"].lower() in ("true", "yes", "1")
+
+    def get_graphql_batch_size(self) -> int:
+        value = self.map["graphql_batch_size"]
+        return int(value) if value != "" else 10
+
+    def get_cassette(self) -> tuple[str, str]:
+        """Path of the request cassette and whether to record or replay it"""
+        mode = (
+            self.map["cassette_mode"] if self.map["cassette_mode"] != "" else "replay"
+        )
+        return os.path.expanduser(self.map["cassette"]), mode
+
+    def get_course_views(self) -> int:
+        """Number of recently opened courses kept ready to switch back to"""
+        value = self.map["course_views"]
+        return int(value) if value != "" else 8
+
+    def get_ttls(self) -> dict[str, float]:
+        """Seconds the cache of a resource stays fresh, e.g. ttl_files=7200"""
+        return {
+            key[4:]: float(value)
+            for key, value in self.map.items()
+            if key.startswith("ttl_") and value != ""
+        }
+
+    def get_refresh_interval(self) -> float:
+        """Seconds between checks for stale resources, 0 to only sync on :reload"""
+        value = self.map["refresh_interval"]
+        return float(value) if value != "" else 60
+
+    def get_cold_compression(self) -> str:
+        """gzip, zlib, lzma or none, the codec of the keep_full cache"""
+        value = self.map["cold_compression"]
+        return value.lower() if value != "" else "gzip"
+
+    def get_cache_budget(self) -> int:
+        """Bytes the cache directory may take, e.g. cache_budget=200M, 0 for
+        no limit"""
+        value = self.map["cache_budget"].strip().upper().removesuffix("B")
+        if value == "":
+            return 0
+        units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+        if value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+
+    def get_download_links(self) -> bool:
+        """Hardlink downloads, read only, to the stored content instead of
+        giving each a copy of its own"""
+        return self.map["download_links"].lower() in ("true", "yes", "1")
+
+    def get_max_in_flight(self) -> int:
+        """Upper bound for the rate limit aware request scheduler"""
+        value = self.map["max_in_flight"]
+        return int(value) if value != "" else 16
+
     def read_config(self, file) -> None:
         for line in file:
             if "=" in line:
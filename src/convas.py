@@ -3,38 +3,69 @@
 # pyright: reportUnknownVariableType=false
 
 import argparse
+import asyncio
 import curses
 import locale
 import os
 import platform
 import subprocess
+import threading
 import time
+from collections import OrderedDict
 from curses import panel
 from curses import error, ERR
-from inspect import getfullargspec
-from json import dumps, loads
+from inspect import signature
 from typing import Any, Callable
+from urllib.parse import urljoin
 
 from config import Config
 from convas_requests import (
-    download_file,
+    Validators,
     get_announcements_request,
     get_assignments_request,
     get_course_info,
     get_current_course_id,
-    get_current_course_names,
-    get_discussions,
     get_files_request,
+    get_paginated_responses,
     get_quizzes_request,
+    set_page_concurrency,
 )
 
 from helper import (
     Logger,
-    clean_up_html,
     hide_panel,
     show_panel,
     show_panel_hide_on_keypress,
 )
+from async_fetch import get_async_client
+from cache import CacheBudget, format_size
+from downloads import DownloadStore
+from canvas_graphql import (
+    GraphQLError,
+    get_course_assignments,
+    to_assignments,
+    to_quizzes,
+)
+from layout import clip, layout
+from projection import ColdStore, project_items
+from refresh import FRESH, STALE, SYNCING, Refresher
+from scheduler import RequestError, scheduler
+from search import FIELDS, SearchIndex
+from stats import stats
+from store import CacheStore
+from terms import TermManifest
+from virtual_list import VirtualList
+from views import (
+    TAB_COLUMNS,
+    TAB_MODELS,
+    TabModel,
+    as_text,
+    build_snapshot,
+    dashboard_rows,
+    unpack,
+)
+from sync import AsyncSyncEngine, SyncEngine, SyncReport, SyncState, merge_items
+from transport import pool, set_cassette
 
 locale.setlocale(locale.LC_ALL, "")
 
@@ -42,6 +73,8 @@ HOME = os.path.expanduser("~")
 CONFIG_FILE = "%s/.config/convas/config" % HOME
 BORDER = 1
 DEV = 1
+POLL_INTERVAL = 500  # ms the input loops wait before checking for fresh data
+FRESHNESS_MARKERS = {FRESH: " ", STALE: "*", SYNCING: "~"}
 
 try:
     with open(CONFIG_FILE) as file:
@@ -56,6 +89,9 @@ if "config" not in globals():
     exit()
 
 headers = {"Authorization": f"Bearer {config.get_token() if config else None}"}
+set_page_concurrency(config.get_page_concurrency())
+scheduler.set_max_concurrency(config.get_max_in_flight())
+cassette = set_cassette(*config.get_cassette())
 
 
 class Menu(object):
@@ -76,7 +112,8 @@ class Menu(object):
 class CourseSubMenu(Menu):
     def __init__(
         self,
-        cache_dir,
+        store: CacheStore,
+        downloads: DownloadStore,
         window: Any,
         course_id: int,
         course_info: dict[str, str],
@@ -84,11 +121,15 @@ class CourseSubMenu(Menu):
         gutter_callback: Callable[[None], None],
         keybind_help: Callable[[list[tuple[str, str]]], None],
         notify: Callable[[str, str], bool],
+        idle: Callable[[], None],
+        view: dict[str, Any] | None = None,
     ):
         self.window = window
         self.course_info = course_info
+        self.view = view
         rows, cols = self.window.getmaxyx()
-        self.cache_dir: str = cache_dir
+        self.store = store
+        self.downloads = downloads
         self.current_os = platform.system()
         self.window.scrollok(True)
         self.window.keypad(1)
@@ -97,6 +138,9 @@ class CourseSubMenu(Menu):
         self.gutter_mode = gutter_callback
         self.set_keybind_help = keybind_help
         self.notify = notify
+        self.idle = idle
+        self.stale = False
+        self.target: tuple[str, Any] | None = None  # the item :search jumps to
         self.tabs = [
             "Home",
             "Announcements",
@@ -104,48 +148,35 @@ class CourseSubMenu(Menu):
             "Quizzes",
             "Files",
         ]
-        self.announcements: list[dict[str, str]] | None = None
-        self.quizzes: list[dict[str, str]] | None = None
-        self.files: list[dict[str, str]] | None = None
+        self.loaded: dict[str, list[dict[str, str]] | None] = {}
+        # tab name, main window width -> the rows drawn for it
+        self.models: dict[tuple[str, int], TabModel] = {}
+        # tab name -> cursor and first visible item of its list
+        self.scroll: dict[str, tuple[int, int]] = {}
         self.side_window = self.window.subwin(rows, int(cols * 0.2), 0, 0)
         self.main_win = self.window.subwin(rows, int(cols * 0.8), 0, int(cols * 0.2))
         self.main_win.scrollok(True)
+        self.side_window.timeout(POLL_INTERVAL)
+        self.main_win.timeout(POLL_INTERVAL)
         self.main_win_panel = panel.new_panel(self.main_win)
         self.main_win_panel.top()
         self.main_win_popup = self.window.subwin(
             int(rows * 0.8), int(cols * 0.6), 0, int(cols * 0.2)
         )
         self.main_win_popup_panel = panel.new_panel(self.main_win)
-        self.main_win_start = 0
-        self.main_win_end = 0
         self.course_id = course_id
-        self.main_rerender = 0
         self.switch_to_statusbar_callback = switch_to_statusbar_callback
 
-        def file_exists(filename: str) -> bool:
-            return subprocess.run(["ls", filename]).returncode == 0
-
-        self.assignments: list[dict[str, str]] = loads(
-            (open(f"{self.cache_dir}assignments{course_id}.json").read())
-        )
-
-        if file_exists(f"{self.cache_dir}files{course_id}.json"):
-            self.files: list[dict[str, str]] = loads(
-                open(f"{self.cache_dir}files{course_id}.json").read()
-            )
-        if file_exists(f"{self.cache_dir}quizzes{course_id}.json"):
-            self.quizzes: list[dict[str, str]] = loads(
-                open(f"{self.cache_dir}quizzes{course_id}.json").read()
-            )
-        if file_exists(f"{self.cache_dir}announcements{course_id}.json"):
-            self.announcements = loads(
-                open(f"{self.cache_dir}announcements{course_id}.json").read()
-            )
-        if not isinstance(self.files, list):
+        # tab data is only read from the store once its tab is opened
+        if view is not None:
+            synced = {name for name, rows in view["tabs"].items() if rows is not None}
+        else:
+            synced = store.synced(course_id)
+        if "files" not in synced:
             self.tabs.remove("Files")
-        if not isinstance(self.quizzes, list):
+        if "quizzes" not in synced:
             self.tabs.remove("Quizzes")
-        if not isinstance(self.announcements, list):
+        if "announcements" not in synced:
             self.tabs.remove("Announcements")
 
         self.dashboard_win = self.window.subwin(
@@ -153,22 +184,95 @@ class CourseSubMenu(Menu):
         )
         self.dashboard_panel = panel.new_panel(self.dashboard_win)
 
-        def display_assignment_info(self):
-            return None
-
-        super().__init__(
-            [
-                [
-                    assignment["name"],
-                    lambda: self.display_assignment_info(assignment["id"]),
-                ]
-                for assignment in self.assignments
-            ],
-            window,
-        )
+        super().__init__([], window)
         self.window.clear()
         self.window.refresh()
 
+    def load(self, resource: str) -> list[dict[str, str]] | None:
+        """The displayed columns of resource, read on first use"""
+        if resource not in self.loaded:
+            if self.view is not None:
+                self.loaded[resource] = unpack(resource, self.view["tabs"][resource])
+            else:
+                self.loaded[resource] = as_text(
+                    resource,
+                    self.store.items(resource, self.course_id, TAB_COLUMNS[resource]),
+                )
+        return self.loaded[resource]
+
+    def tab_model(self, entry: str) -> TabModel | None:
+        """The rows of tab entry, built once per width of the main window and
+        shared by its first draw and its input loop"""
+        if entry not in TAB_MODELS:
+            return None
+        _, cols = self.main_win.getmaxyx()
+        model = self.models.get((entry, cols))
+        if model is None:
+            resource, builder = TAB_MODELS[entry]
+            model = builder(self.load(resource) or [], cols)
+            self.models[(entry, cols)] = model
+        return model
+
+    def dashboard(self) -> dict[str, Any]:
+        if self.view is not None:
+            return self.view["dashboard"]
+        return dashboard_rows(
+            self.course_info,
+            self.store.first(
+                "announcements", self.course_id, ["title", "message", "created_at"]
+            ),
+            self.store.items("assignments", self.course_id, ["name", "submission"]),
+        )
+
+    def invalidate(self, view: dict[str, Any] | None = None) -> None:
+        """Drop the loaded tabs once a sync has replaced them, view being the
+        new snapshot of the course if there is one. An open tab re-renders
+        the next time its input loop is idle"""
+        self.loaded.clear()
+        self.models.clear()
+        self.view = view
+        self.stale = True
+
+    def jump(self, resource: str, item_id: Any) -> None:
+        """Open the tab of resource with the cursor on item_id, the dashboard
+        for a course (syllabus) search hit"""
+        tab = resource.capitalize()
+        if tab not in self.tabs:
+            self.run()
+            return
+        self.target = (resource, item_id)
+        self.tab_index = self.tabs.index(tab)
+        self.win_index = 3
+        self.position = 0
+        self.run_main_win()
+
+    def seek(self, resource: str) -> int | None:
+        """Index of the jump target in the tab of resource being opened"""
+        if self.target is None or self.target[0] != resource:
+            return None
+        _, item_id = self.target
+        self.target = None
+        for index, item in enumerate(self.load(resource) or []):
+            if item["id"] == item_id:
+                return index
+        return None
+
+    @property
+    def assignments(self) -> list[dict[str, str]]:
+        return self.load("assignments") or []
+
+    @property
+    def announcements(self) -> list[dict[str, str]] | None:
+        return self.load("announcements")
+
+    @property
+    def quizzes(self) -> list[dict[str, str]] | None:
+        return self.load("quizzes")
+
+    @property
+    def files(self) -> list[dict[str, str]] | None:
+        return self.load("files")
+
     def initialize_dashboard(self):
         rows, cols = self.dashboard_win.getmaxyx()
         srows, scols = self.dashboard_win.getbegyx()
@@ -193,95 +297,31 @@ class CourseSubMenu(Menu):
             scols + int(cols * 0.65),
         )
 
-        syllabus = self.course_info["syllabus_body"]
-        if syllabus:
+        dashboard = self.dashboard()
+        if dashboard["syllabus"]:
             self.dashboard_syllabus = self.dashboard_win.subwin(
                 int(rows * 0.4) - 2, int(cols * 0.7), srows + 2, scols + int(cols * 0.3)
             )
             self.dashboard_syllabus.border()
             self.wrap_content_around_win(
-                "Syllabus\n" + clean_up_html(syllabus), self.dashboard_syllabus, True
+                "Syllabus\n" + dashboard["syllabus"], self.dashboard_syllabus, True
             )
             self.dashboard_syllabus.refresh()
         else:  # if no syllabus, expand course_info
             self.dashboard_course_info.resize(int(rows * 0.4) - 2, cols)
             self.dashboard_course_info.border()
 
-        title = ""
-        msg = ""
-        date = ""
-        if self.announcements and len(self.announcements):
-            latest_announcement = self.announcements[-1]
-            msg = clean_up_html(latest_announcement["message"])
-            title = latest_announcement["title"]
-            date = latest_announcement["created_at"][:10]
-
         self.wrap_content_around_win(
-            [
-                "Latest Announcement\n",
-                (f"Title: { title }") if title != "" else "No announcements",
-                (f"Date: {date}") if len(date) else "",
-                msg,
-            ],
-            self.dashboard_announcement,
-            True,
+            dashboard["announcement"], self.dashboard_announcement, True
         )
-
-        upcoming_assignments = [""]
-        completed_assignments = [""]
-        if self.assignments and len(self.assignments):
-            completed_assignments = [
-                assignment["name"]
-                for assignment in self.assignments
-                if "submission" not in assignment.keys()
-            ]
-            upcoming_assignments = [
-                assignment["name"]
-                for assignment in self.assignments
-                if ("submission" in assignment.keys())
-                and assignment["submission"]["submitted_at"] != 0
-            ]
         self.wrap_content_around_win(
-            ["Upcoming assignments", " "]
-            + (
-                upcoming_assignments
-                if len(upcoming_assignments)
-                else ["No upcoming assignments"]
-            ),
-            self.upcoming_assignments,
-            True,
+            dashboard["upcoming"], self.upcoming_assignments, True
         )
         self.wrap_content_around_win(
-            ["Completed assignments", " "]
-            + (
-                completed_assignments
-                if len(completed_assignments)
-                else ["No completed assignments"]
-            ),
-            self.completed_assignments,
-            True,
+            dashboard["completed"], self.completed_assignments, True
         )
-
-        course_full_name = self.course_info["name"]
-        self.dashboard_heading.addstr(0, 1, f"{ course_full_name }")
-
-        teacher = self.course_info["teachers"][0]["display_name"]
-        started_at = self.course_info["term"]["start_at"][:10]
-        score = str(
-            list(
-                filter(
-                    lambda enrollment: enrollment["type"] == "student",
-                    self.course_info["enrollments"],
-                )
-            )[0]["computed_current_score"]
-        )
-        course_info_content = [
-            f"Started at: { started_at }",
-            f"Instructor: { teacher }",
-            f"Score: { score }",
-            f"Course ID: {self.course_id}",
-        ]
-        self.wrap_content_around_win(course_info_content, self.dashboard_course_info)
+        self.dashboard_heading.addstr(0, 1, clip(dashboard["heading"], cols - 2))
+        self.wrap_content_around_win(dashboard["info"], self.dashboard_course_info)
 
         self.dashboard_announcement.border()
         self.completed_assignments.border()
@@ -316,44 +356,7 @@ class CourseSubMenu(Menu):
 
     def display_main_win(self, heading: int):
         entry = self.tabs[heading].lower()
-        rows_per_item = 1
-        right_side_str: list[str, str] | None = None
-        left_side_str: list[str, str] | None = None
-        right_offset: list[str, str] | None = None
-        rows, cols = self.main_win.getmaxyx()
-        if entry == "assignments":
-            max_rows = rows - 2
-            left_side_str = [["Assignment Name", ""]] + [
-                (
-                    [assignment["name"], ""]
-                    if len(assignment["name"]) < 30
-                    else [assignment["name"][:30] + "...", ""]
-                )
-                for assignment in self.assignments
-            ]
-            right_side_str = [["Points   Created at", ""]]
-
-            for assignment in self.assignments:
-                if ("submission" in assignment.keys()) and assignment["submission"][
-                    "submitted_at"
-                ] != 0:
-                    points = (
-                        f"{assignment['submission']['score']}{assignment['points_possible']}",
-                    )
-                else:
-                    points = f"{assignment['points_possible']}"
-                right_side_str += [[f"{points}   {assignment['created_at'][:10]}", ""]]
-                right_offset = [
-                    [(cols - len(str(right_str[0])) - 3), 0]
-                    for right_str in right_side_str
-                ]
-            rows_per_item = 2
-            self.main_win_end = min(
-                (len(left_side_str) - self.main_win_start),
-                (max_rows - rows_per_item) // rows_per_item,
-            )
-
-        elif entry == "home":
+        if entry == "home":
             # TODO: change initalize_dashboard to just be show_hide
             hide_panel(self.main_win_panel, self.main_win)
             self.initialize_dashboard()
@@ -374,115 +377,12 @@ class CourseSubMenu(Menu):
             # 	"⡇", "⡏", "⡟", "⡿", "⣿"
             # }},
 
-        elif entry == "announcements":
-            left_side_str = [
-                [announcement["user_name"], announcement["title"], ""]
-                for announcement in self.announcements
-            ]
-            right_side_str = [
-                [announcement["created_at"][:10], "", ""]
-                for announcement in self.announcements
-            ]
-            right_offset = [
-                [(cols - len(str(right_str)) - 3), 0, 0] for right_str in right_side_str
-            ]
-            rows_per_item = 3
-
-        elif entry == "discussions":
-            discussions = get_discussions(self.assignments)
-            left_side_str = [assignment["name"] for assignment in discussions]
-
-        elif entry == "grades":
-            left_side_str = [
-                [assignment["name"], assignment["submission"]["submitted_at"][:10], ""]
-                for assignment in self.assignments
-                if ("submission" in assignment.keys())
-                and assignment["submission"]["submitted_at"] != 0
-            ]
-            right_side_str = [
-                [
-                    f"{assignment['points_possible']}/ {assignment['submission']['score']}",
-                    "",
-                    "",
-                ]
-                for assignment in self.assignments
-                if ("submission" in assignment.keys())
-                and assignment["submission"]["submitted_at"] != -1
-            ]
-            right_offset = [
-                [(cols - len(str(right_str)) - 3), 0, 0] for right_str in right_side_str
-            ]
-            rows_per_item = 3
-
-        elif entry == "quizzes":
-            left_side_str = [["Quiz name", ""]] + [
-                [quiz["title"][0:20], ""] for quiz in self.quizzes
-            ]
-            right_side_str = [["Date created", ""]] + [
-                [f"{quiz['due_at'][:10]}", ""] for quiz in self.quizzes
-            ]
-            right_offset = [
-                [(cols - len(str(right_str)) - 3), 0] for right_str in right_side_str
-            ]
-            rows_per_item = 2
-
-        elif entry == "files":
-            left_side_str = [["Filename", ""]] + [
-                [file["display_name"][:30], ""] for file in self.files
-            ]
-            right_side_str = [["filetype  " + "created_at", ""]] + [
-                [f"{file['mime_class']}  {file['updated_at'][:10]} ", ""]
-                for file in self.files
-            ]
-            right_offset = [
-                [(cols - len(str(right_str[0])) - 3), 0] for right_str in right_side_str
-            ]
-            rows_per_item = 2
-
-        if not left_side_str:
+        model = self.tab_model(entry)
+        if model is None or not model.left:
             return
-        self.main_win.erase()
-        self.main_win.border()
-
-        max_rows = rows - 2
-        self.main_win_end = min(
-            (len(left_side_str) - self.main_win_start),
-            (max_rows - rows_per_item) // rows_per_item,
-        )
-        for index, item in enumerate(
-            left_side_str[self.main_win_start : self.main_win_end]
-        ):
-            if isinstance(item, str):
-                if item != "":
-                    self.main_win.addstr(1 + index, 1, item)
-                else:
-                    self.main_win.hline(index + 1, 1, curses.ACS_HLINE, cols - 2)
-            else:
-                for i in range(len(item)):
-                    if item[i] != "":
-                        self.main_win.addstr(rows_per_item * index + i + 1, 1, item[i])
-                    else:
-                        self.main_win.hline(
-                            rows_per_item * index + i + 1, 1, curses.ACS_HLINE, cols - 2
-                        )
-        if right_side_str:
-            for index, item in enumerate(
-                right_side_str[self.main_win_start : self.main_win_end]
-            ):
-                if isinstance(item, str):
-                    self.main_win.addstr(
-                        1 + index,
-                        (right_offset[index] if right_offset is not None else 1),
-                        item,
-                    )
-                else:
-                    for i in range(len(item)):
-                        self.main_win.addstr(
-                            1 + rows_per_item * index + i,
-                            (right_offset[index][i] if right_offset is not None else 1),
-                            item[i],
-                        )
-        self.main_win.refresh()
+        view = VirtualList(self.main_win, model, cursor=False)
+        view.place(*self.scroll.get(entry, (0, 0)))
+        view.draw()
 
     def toggle_side_main_win(self):
         if self.win_index == 2:
@@ -518,46 +418,21 @@ class CourseSubMenu(Menu):
             stderr=subprocess.DEVNULL,
         )
 
-    @staticmethod
     def wrap_content_around_win(
         self, content: str | list[str], win: Any, is_header=False
     ):
+        """Draw content word wrapped inside the border of win, the first line
+        in bold for a header"""
         h, w = win.getmaxyx()
-        Logger.info(f" {h} {w}")
-        linenm = 1
         bolden = curses.A_BOLD if is_header else curses.A_NORMAL
-        if isinstance(content, list):
-            for row in content:
-                row = clean_up_html(row)
-                row = row.replace("\n", "")
-                lines = (len(row) + w + BORDER * 2 - 1) // w
-                start = 0
-                end = w - 2
-                for line in range(lines):
-                    if linenm + line == h:
-                        return
-                    win.addstr(linenm, 1, row[start:end], bolden)
-                    bolden = curses.A_NORMAL
-
-                    linenm += 1
-                    start = end
-                    end += w - BORDER
-        elif isinstance(content, str):
-            content = clean_up_html(content)
-            lines = (len(content) + w + BORDER * 2 - 1) // w
-            start = 0
-            end = w - BORDER * 2
-            for line in range(lines):
-                Logger.info(lines)
-                if linenm == h - 2:
-                    return
-                try:
-                    win.addstr(linenm + line, 1, content[start : end + 1], bolden)
-                    bolden = curses.A_NORMAL
-                except curses.error:
-                    win.border()
-                start = end
-                end += w - BORDER * 2
+        for index, line in enumerate(
+            layout.lines(content, w - BORDER * 2)[: h - BORDER * 2]
+        ):
+            try:
+                win.addstr(BORDER + index, BORDER, line, bolden)
+            except curses.error:  # the terminal disagrees on a character width
+                pass
+            bolden = curses.A_NORMAL
         win.noutrefresh()
 
     def main_win_panel_render(self, content: str | list[str]):
@@ -565,456 +440,101 @@ class CourseSubMenu(Menu):
         self.main_win_panel.hide()
         self.main_win_popup.erase()
         self.main_win_popup.border()
-        h, w = self.main_win_popup.getmaxyx()
-        if isinstance(content, list):
-            for row in content:
-                lines = (len(row) + w + 2 - 1) // w
-                s = 0
-                e = w - 2
-                for line in range(lines):
-                    self.main_win_popup.addstr(line + 1, 1, row[s:e])
-                    s = e
-                    e += w - 2
-        elif isinstance(content, str):
-            lines = (len(content) + w + 2 - 1) // w
-            s = 0
-            e = w - 2
-            for line in range(lines):
-                self.main_win_popup.addstr(line + 1, 1, content[s:e])
-                s = e
-                e += w - 2
+        self.wrap_content_around_win(content, self.main_win_popup)
         self.main_win_popup.refresh()
         show_panel_hide_on_keypress(self.main_win_popup_panel, self.main_win)
 
+    def tab_actions(
+        self, entry: str
+    ) -> dict[int, tuple[str, str, Callable[[dict[str, Any]], Any]]]:
+        """Keys acting on the item under the cursor of tab entry: their help,
+        and callback taking the item"""
+
+        def show_annoucement(announcement: dict[str, Any]):
+            self.main_win_panel_render([announcement["message"]])
+
+        def download_file_at_cursor(file: dict[str, Any]):
+            if self.current_os == "Linux":
+                download_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+            elif self.current_os == "Windows":
+                download_dir = os.path.join(os.environ["USERPROFILE"], "Downloads")
+            elif self.current_os == "darwin":
+                download_dir = os.path.expanduser("~/Downloads")
+            else:
+                download_dir = os.path.expanduser("~/Downloads")
+            name = file["display_name"]
+            download = self.downloads.get(
+                file,
+                self.course_id,
+                urljoin(config.get_domain(), file["url"]),
+                os.path.join(download_dir, name),
+                headers={},
+            )
+            if not download:
+                self.notify("Error: ", "file not downloaded")
+                return None
+            # linked or copied when this version was downloaded before
+            self.notify("Downloaded", f"{name} {download} to {download_dir}")
+
+        def open_in_browser(item: dict[str, Any]):
+            self.open_url(self.current_os, item["html_url"])
+
+        return {
+            "assignments": {ord("o"): ("o", "open in browser", open_in_browser)},
+            "announcements": {ord("o"): ("o", "open", show_annoucement)},
+            "quizzes": {ord("o"): ("o", "open in browser", open_in_browser)},
+            "files": {ord("d"): ("d", "download", download_file_at_cursor)},
+        }.get(entry, {})
+
     def run_main_win(self):
+        entry = self.tabs[self.tab_index].lower()
+        model = self.tab_model(entry)
+        if model is None:  # the dashboard has nothing to select
+            self.toggle_side_main_win()
+            return
+        actions = self.tab_actions(entry)
         self.set_keybind_help(
             [
                 ("j", "next"),
                 ("k", "prev"),
+                ("^d/^u", "half page"),
+                ("^f/^b", "page"),
+                ("g/G", "top/bottom"),
                 (":", "cmd mode"),
                 ("h", "switch to side panel"),
-                ("o", "open in browser"),
             ]
+            + [(key, help) for key, help, _ in actions.values()]
         )
-
-        def main_win_loop(
-            left_side_str: list[str] | list[list[str]],
-            bindings: list[tuple[int, Callable[[None], Any] | Callable[str, Any], str]],
-            right_side_str: list[str] | None = None,
-            right_offset: int | None = None,
-            args: list[str] | None = None,
-        ):
-            self.main_rerender = 1
-            has_right = right_side_str is not None
-
-            def rerender_main_win():
-                self.main_win.border()
-                for index in range(self.main_win_start, self.main_win_end):
-                    left = left_side_str[index]
-                    right = right_side_str[index] if has_right else None
-                    offset = right_offset[index] if has_right else None
-                    if isinstance(left, str):
-                        self.main_win.addstr(1 + index, 1, left[index])
-                        self.main_win.addstr(
-                            1 + index * rows_per_item,
-                            (offset if offset is not None else 1),
-                            left[index],
-                        )
-                    else:
-                        for i in range(rows_per_item):
-                            if left[i] != "":
-                                self.main_win.addstr(
-                                    rows_per_item * (index - self.main_win_start)
-                                    + i
-                                    + 1,
-                                    1,
-                                    left[i],
-                                )
-                            else:
-                                self.main_win.hline(
-                                    rows_per_item * (index - self.main_win_start)
-                                    + i
-                                    + 1,
-                                    1,
-                                    curses.ACS_HLINE,
-                                    cols - 2,
-                                )
-                            if has_right:
-                                self.main_win.addstr(
-                                    1
-                                    + rows_per_item * (index - self.main_win_start)
-                                    + i,
-                                    (offset[i] if offset is not None else 1),
-                                    right[i] if right else "",
-                                )
-                return 0  # return 0 to stop rerendering all entries again
-
-            while True:
-                if self.main_rerender:
-                    self.main_win.erase()
-                    self.main_rerender = rerender_main_win()
-                for index in range(self.main_win_start, self.main_win_end):
-                    if not (
-                        self.position == index
-                        or self.position - 1 == index
-                        or self.position + 1 == index
-                    ):  # rerender only if the entry is the previous or the next one of self.position
-                        continue
-                    mode = (
-                        curses.A_NORMAL if index != self.position else curses.A_REVERSE
-                    )
-                    left = left_side_str[index]
-                    right = right_side_str[index] if has_right else ""
-                    offset = right_offset[index] if has_right else 1
-                    if isinstance(left, str):
-                        self.main_win.addstr(1 + index, 1, left, mode)
-                        self.main_win.addstr(
-                            1 + index * rows_per_item,
-                            (offset),
-                            right,
-                            mode,
-                        )
-                    else:
-                        for i in range(rows_per_item):
-                            self.main_win.addstr(
-                                rows_per_item * (index - self.main_win_start) + i + 1,
-                                1,
-                                left[i],
-                                mode,
-                            )
-                            if has_right:
-                                self.main_win.addstr(
-                                    1
-                                    + rows_per_item * (index - self.main_win_start)
-                                    + i,
-                                    (offset[i] if offset is not None else 1),
-                                    right[i],
-                                    mode,
-                                )
-
-                self.main_win.refresh()
-                key = self.main_win.getch()
-
-                if key == ord("h"):
-                    self.main_win_render = 1
-                    self.main_win_start = 0
-                    self.main_win_end = 0
+        items = self.load(TAB_MODELS[entry][0]) or []
+        view = VirtualList(self.main_win, model)
+        view.place(*self.scroll.get(entry, (0, 0)))
+        target = self.seek(TAB_MODELS[entry][0])
+        if target is not None:
+            view.move(target)
+        view.draw()
+        while True:
+            key = self.main_win.getch()
+            if key == -1:
+                self.idle()
+                if self.stale:
                     break
-                elif key == ord(":"):
-                    self.gutter_mode()
-
-                for binding in bindings:
-                    if key == binding[0]:
-                        callback_signature_args = getfullargspec(binding[1]).args
-                        if callback_signature_args == []:
-                            binding[1]()
-                            self.main_rerender = 1
-                        elif (
-                            len(callback_signature_args) == 1
-                            and callback_signature_args[0] == "url"
-                        ):
-                            binding[1](args[self.position])
-                            self.main_rerender = 0
-
-        entry = self.tabs[self.tab_index].lower()
-        rows_per_item = 1
-        rows, cols = self.main_win.getmaxyx()
-
-        if entry == "assignments":
-
-            def navigate(n: int):
-                if (
-                    self.position + n <= self.main_win_end - 1
-                    and self.position + n >= self.main_win_start + 1
-                ):
-                    self.position += n
-                elif self.position + n > len(self.assignments) + 1:
-                    return
-                elif self.main_win_start + 1 > self.position + n:
-                    if self.main_win_start + n >= 0:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-                elif self.position + n > self.main_win_start + 1:
-                    if (
-                        self.main_win_start + n + self.position
-                        < len(self.assignments) + 1
-                    ):
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-
-            left_side_str = [["Assignment Name", ""]] + [
-                (
-                    [assignment["name"], ""]
-                    if len(assignment["name"]) < 30
-                    else [assignment["name"][:30] + "...", ""]
-                )
-                for assignment in self.assignments
-            ]
-            right_side_str = [["Points   Created at", ""]]
-
-            for assignment in self.assignments:
-                if ("submission" in assignment.keys()) and assignment["submission"][
-                    "submitted_at"
-                ] != 0:
-                    points = (
-                        f"{assignment['submission']['score']}{assignment['points_possible']}",
-                    )
-                else:
-                    points = f"{assignment['points_possible']}"
-                right_side_str += [[f"{points}   {assignment['created_at'][:10]}", ""]]
-                right_offset = [
-                    [(cols - len(str(right_str[0])) - 3), 0]
-                    for right_str in right_side_str
-                ]
-            rows_per_item = 2
-            max_rows = rows - 2
-
-            self.main_win_end = min(
-                (len(left_side_str) - self.main_win_start),
-                (max_rows - rows_per_item) // rows_per_item,
-            )
-            self.position = 1
-            main_win_loop(
-                left_side_str,
-                [
-                    (ord("j"), lambda: navigate(1)),
-                    (ord("k"), lambda: navigate(-1)),
-                    (
-                        ord("o"),
-                        lambda: self.open_url(
-                            self.current_os,
-                            self.assignments[self.main_win_start + self.position][
-                                "html_url"
-                            ],
-                        ),
-                    ),
-                ],
-                right_side_str,
-                right_offset,
-            )
-
-        elif entry == "announcements":
-
-            def navigate(n: int) -> bool:
-                if (
-                    self.position + n <= self.main_win_end - 1
-                    and self.position + n >= self.main_win_start
-                ):
-                    self.position += n
-                elif (
-                    self.position + n + self.main_win_start
-                    > len(self.announcements) - 1
-                ):
-                    return
-                elif self.main_win_start > self.position + n:
-                    if self.main_win_start + n >= 0:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-                elif self.position + n > self.main_win_start:
-                    if self.main_win_start + n + self.position < len(
-                        self.announcements
-                    ):
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-
-            def show_annoucement(id: int):
-                message = [
-                    clean_up_html(anouncement["message"])
-                    for anouncement in self.announcements
-                    if anouncement["id"] == id
-                ]
-                self.main_win_panel_render(message)
-
-            # fmt: off
-            left_side_str = [ [announcement["user_name"], announcement["title"], ""] for announcement in self.announcements ]
-            right_side_str = [ [announcement["created_at"][:10], "", ""] for announcement in self.announcements ]
-            right_offset = [ [(cols - len(str(right_str)) - 3), 0, 0] for right_str in right_side_str ] 
-            rows_per_item = 3
-            max_rows = rows - 2
-            self.main_win_end = ( min((len(left_side_str[self.main_win_start :])), (max_rows - rows_per_item) // rows_per_item,) )
-
-            # fmt: on
-            main_win_loop(
-                left_side_str,
-                [
-                    (
-                        ord("j"),
-                        lambda: navigate(1),
-                    ),
-                    (ord("k"), lambda: navigate(-1)),
-                    (
-                        ord("o"),
-                        lambda: show_annoucement(
-                            self.announcements[self.position + self.main_win_start][
-                                "id"
-                            ]
-                        ),
-                    ),
-                ],
-                right_side_str,
-                right_offset,
-            )
-
-        elif entry == "quizzes":
-
-            def navigate(n: int):
-                if (
-                    self.position + n <= self.main_win_end - 1
-                    and self.position + n >= self.main_win_start + 1
-                ):
-                    self.position += n
-                elif self.position + n > len(self.quizzes) + 1:
-                    return
-                elif self.main_win_start + 1 > self.position + n:
-                    if self.main_win_start + n >= 0:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-                elif self.position + n > self.main_win_start + 1:
-                    if self.main_win_start + n + self.position < len(self.quizzes) + 1:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-
-            left_side_str = [["Quiz name", ""]] + [
-                [quiz["title"][0:30], ""] for quiz in self.quizzes
-            ]
-            right_side_str = [["Date created", ""]] + [
-                [f"{quiz['due_at'][:10]}", ""] for quiz in self.quizzes
-            ]
-            right_offset = [
-                [(cols - len(str(right_str)) - 3), 0] for right_str in right_side_str
-            ]
-            max_rows = rows - 2
-
-            rows_per_item = 2
-            self.position = 1
-            self.main_win_start = 0
-            self.main_win_end = min(
-                (len(left_side_str[self.main_win_start :])),
-                (max_rows - rows_per_item) // rows_per_item,
-            )
-            main_win_loop(
-                left_side_str,
-                [
-                    (
-                        ord("j"),
-                        lambda: navigate(1),
-                    ),
-                    (
-                        ord("k"),
-                        lambda: navigate(-1),
-                    ),
-                    (
-                        ord("o"),
-                        lambda: self.open_url(
-                            self.current_os,
-                            self.quizzes[self.main_win_start + self.position][
-                                "html_url"
-                            ],
-                        ),
-                    ),
-                ],
-                right_side_str,
-                right_offset,
-            )
-
-        elif entry == "files":
-
-            def navigate(n: int):
-                if (
-                    self.position + n <= self.main_win_end - 1
-                    and self.position + n >= self.main_win_start + 1
-                ):
-                    self.position += n
-                elif self.position + n > len(self.files) + 1:
-                    return
-                elif self.main_win_start + 1 > self.position + n:
-                    if self.main_win_start + n >= 0:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-                elif self.position + n > self.main_win_start + 1:
-                    if self.main_win_start + n + self.position < len(self.files) + 1:
-                        self.main_win_start += n
-                        self.position += n
-                        self.main_win_end += n
-                        self.main_rerender = 1
-
-            left_side_str = [["Filename", ""]] + [
-                [file["display_name"][:30], ""] for file in self.files
-            ]
-            right_side_str = [["filetype  " + "created_at", ""]] + [
-                [f"{file['mime_class']}  {file['updated_at'][:10]} ", ""]
-                for file in self.files
-            ]
-            right_offset = [
-                [(cols - len(str(right_str[0])) - 3), 0] for right_str in right_side_str
-            ]
-            rows_per_item = 2
-
-            def download_file_at_cursor(
-                current_os: str, url: str, file_id: str, name: str
-            ):
-                if current_os == "Linux":
-                    download_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-                elif current_os == "Windows":
-                    download_dir = os.path.join(os.environ["USERPROFILE"], "Downloads")
-                elif current_os == "darwin":
-                    download_dir = os.path.expanduser("~/Downloads")
-                else:
-                    download_dir = os.path.expanduser("~/Downloads")
-                file_path = os.path.join(download_dir, name)
-                download = download_file(
-                    url,
-                    file_id,
-                    course_id=self.course_id,
-                    outfile=file_path,
-                    headers={},
-                )
-                if not download:
-                    self.notify("Error: ", "file not downloaded")
-                    return None
-                self.notify("Downloaded", f"{name} downloaded to {download_dir}")
-
-            max_rows = rows - 2
-            self.main_win_end = min(
-                (len(left_side_str[self.main_win_start :])),
-                (max_rows - rows_per_item) // rows_per_item,
-            )
-            self.position = 1
-
-            main_win_loop(
-                left_side_str,
-                [
-                    (ord("j"), lambda: navigate(1), "down"),
-                    (ord("k"), lambda: navigate(-1), "up"),
-                    (
-                        ord("d"),
-                        lambda: download_file_at_cursor(
-                            self.current_os,
-                            self.files[self.position]["url"],
-                            self.files[self.position]["id"],
-                            self.files[self.position]["display_name"],
-                        ),
-                        "down",
-                    ),
-                ],
-                right_side_str,
-                right_offset,
-            )
+            elif key == ord("h"):
+                break
+            elif key == ord(":"):
+                self.gutter_mode()
+                view.draw()
+            elif key in actions and view.selected is not None:
+                actions[key][2](items[view.selected])
+                view.draw()
+            else:
+                view.handle(key)
+        self.scroll[entry] = (view.cursor, view.top)
 
+        if self.stale:  # the tab was refreshed while it was open
+            self.stale = False
+            self.display()
+            self.run_main_win()
+            return
         self.toggle_side_main_win()
 
     def run(self):
@@ -1043,7 +563,15 @@ class CourseSubMenu(Menu):
             self.side_window.refresh()
 
             key = self.side_window.getch()
-            if key == curses.KEY_UP or key == ord("k"):
+            if key == -1:
+                self.idle()
+                if self.stale:
+                    self.stale = False
+                    self.display()
+                    if self.tabs[self.tab_index] != "Home":
+                        self.display_main_win(self.tab_index)
+
+            elif key == curses.KEY_UP or key == ord("k"):
                 self.navigate(-1)
 
             elif key == curses.KEY_DOWN or key == ord("j"):
@@ -1077,8 +605,11 @@ class StatusBar(Menu):
         update_callback: Callable[int, None],
         change_win_callback: Callable[Any, None],
         set_keybind_help: Callable[list[tuple[str, str]], None],
+        freshness: Callable[[int], str],
+        idle: Callable[[], None],
     ):
         self.window = curses.newwin(3, width, height - 3, 0)
+        self.window.timeout(POLL_INTERVAL)
         self.position = 0
         self.course_ids = course_ids
         self.courses = [
@@ -1099,6 +630,12 @@ class StatusBar(Menu):
             "q": lambda: None,
         }
         self.set_keybind_help = set_keybind_help
+        self.freshness = freshness
+        self.idle = idle
+
+    def marker(self, index: int) -> str:
+        """Freshness of the cache of the course at index, as one character"""
+        return FRESHNESS_MARKERS[self.freshness(self.course_ids[index])]
 
     def add_cmd(self, cmd: str, callback: Callable[None, None], alias="") -> None:
         self.cmds[cmd] = callback
@@ -1118,7 +655,7 @@ class StatusBar(Menu):
         status_offset = 1
         for index, course in enumerate(self.courses):
             status_offset += 2
-            msg = "%d.%s " % (index, course[0])
+            msg = "%d.%s%s" % (index, course[0], self.marker(index))
             self.window.addstr(1, status_offset + index, msg, curses.A_NORMAL)
             self.window.addstr(1, status_offset + index + 3, "")
             status_offset += len(course[0])
@@ -1136,12 +673,14 @@ class StatusBar(Menu):
             self.window.border()
             for index, course in enumerate(self.courses):
                 mode = curses.A_REVERSE if index == self.position else curses.A_NORMAL
-                msg = "%d.%s" % (index, course[0])
-                self.window.addstr(1, left_offset + index, msg + " " * 2, mode)
+                msg = "%d.%s%s" % (index, course[0], self.marker(index))
+                self.window.addstr(1, left_offset + index, msg + " ", mode)
                 left_offset += len(course[0]) + 2
             self.window.refresh()
             key = self.window.getch()
-            if key in [curses.KEY_ENTER, ord("\n")]:
+            if key == -1:
+                self.idle()
+            elif key in [curses.KEY_ENTER, ord("\n")]:
                 submenu = self.update_callback(self.course_ids[self.position])
                 self.prev_win = submenu
                 submenu.display()
@@ -1159,11 +698,20 @@ class StatusBar(Menu):
         self.window.refresh()
 
     @staticmethod
-    def eval_command(cmds: dict[str, Callable[None, None]], cmd: str) -> bool:
-        if cmd in cmds.keys():
-            cmds[cmd]()
-            return True
-        return False
+    def eval_command(cmds: dict[str, Callable[..., None]], cmd: str) -> bool:
+        """Run a command, passing what follows its name to the commands that
+        take an argument, e.g. :search midterm room"""
+        name, _, arg = cmd.strip().partition(" ")
+        if name not in cmds.keys():
+            return False
+        parameters = signature(cmds[name]).parameters.values()
+        if any(parameter.default is parameter.empty for parameter in parameters):
+            cmds[name](arg.strip())
+        elif arg.strip():
+            return False
+        else:
+            cmds[name]()
+        return True
 
     def gutter_mode(self) -> None:
         input = TextInput(self.window, lambda cmd: self.eval_command(self.cmds, cmd))
@@ -1186,8 +734,10 @@ class TextInput:
             self.window.addstr(1, 1, buffer)
             self.window.refresh()
             key = self.window.getch()
-            if chr(key).isalpha():
-                buffer = buffer[:cursor] + chr(key) + buffer[cursor:]
+            if key == -1:
+                continue
+            elif 32 <= key < 127:  # printable ascii, commands take arguments
+                buffer = buffer[: cursor - 1] + chr(key) + buffer[cursor - 1 :]
                 cursor += 1
             elif key == curses.KEY_BACKSPACE or key == 127:
                 buffer = buffer[:-1]
@@ -1215,8 +765,283 @@ class TextInput:
                     return buffer
 
 
+class CacheSync:
+    """The cache of a term and the syncs that fill it, without a screen"""
+
+    def __init__(self, cache_dir: str, term: str, backend: str = ""):
+        self.cache_dir = cache_dir
+        # the term syncs fetch, while :term may show an archived one
+        self.term = term
+        self.backend = backend or config.get_backend()
+        self.store = CacheStore(cache_dir)
+        self.cache = CacheBudget(cache_dir, config.get_cache_budget())
+        self.search = SearchIndex(cache_dir, self.store)
+        self.terms = TermManifest(cache_dir)
+
+    def make_api_calls(
+        self,
+        get_courses,
+        get_assignments,
+        get_announcements,
+        get_files,
+        get_quizzes,
+        term_name="",
+        delta=False,
+    ) -> SyncReport:
+        """Method to make all api calls and cache them.
+        With delta, only items newer than the last sync are requested where
+        Canvas allows it, and merged into the existing cache files"""
+        domain = config.get_domain()
+        # never the archived term the UI may be showing
+        term = self.term
+
+        cold = (
+            ColdStore(self.cache_dir, config.get_cold_compression())
+            if config.get_keep_full()
+            else None
+        )
+
+        if self.backend == "async":
+            client = get_async_client()
+            paginate = client.get_paginated_responses
+            engine = AsyncSyncEngine(client)
+            wait = client.run
+        else:
+            paginate = get_paginated_responses
+            engine = SyncEngine(config.get_concurrency())
+            wait = lambda result: result
+
+        # if the courses are cached, then don't fetch them till the user installs
+        courses_info = self.store.courses() or None
+        if courses_info is None or get_courses:
+            validators = Validators(self.store.validators("courses"))
+            try:
+                courses_info = wait(
+                    get_course_info(
+                        f"{domain}api/v1/courses",
+                        headers,
+                        validators,
+                        paginate=paginate,
+                    )
+                )
+                if cold:
+                    cold.write("courses", courses_info)
+                courses_info = project_items("courses", courses_info)
+                self.store.replace_courses(courses_info, validators.records())
+            except RequestError as e:
+                Logger.info(f"Keeping cached courses: {e}")
+                if courses_info is None:
+                    print(f"Unable to fetch courses: {e}")
+                    exit()
+
+        course_ids: list[str] = get_current_course_id(courses_info, term)
+        # the store keeps the courses of other terms after the fetched ones
+        current = [course for course in courses_info if course["id"] in course_ids]
+        start_date = (current or courses_info)[-1]["term"]["start_at"][:10]
+        state = SyncState(f"{self.cache_dir}sync_state.json")
+        # (resource, course id) merged by this sync, to re-index afterwards
+        merged: set[tuple[str, int]] = set()
+
+        def cache_to(
+            resource: str, id: str, validators: Validators | None = None
+        ) -> Callable[[Any], None]:
+            def write(json_obj: Any):
+                if cold:
+                    cold.write(f"{resource}{id}", json_obj)
+                if resource in FIELDS:
+                    # from the unprojected items, assignment descriptions included
+                    self.search.update(
+                        resource,
+                        id,
+                        json_obj,
+                        validators.unchanged() if validators else None,
+                    )
+                json_obj = project_items(resource, json_obj)
+                # the validators go in with the items they describe
+                self.store.replace(
+                    resource, id, json_obj, validators.records() if validators else None
+                )
+                state.update(resource, id, json_obj)
+
+            return write
+
+        def merge_into(resource: str, id: str) -> Callable[[Any], None]:
+            def merge(json_obj: Any):
+                if json_obj is None:
+                    return
+                if cold:
+                    name = f"{resource}{id}"
+                    cold.write(name, merge_items(cold.read(name), json_obj))
+                items = merge_items(
+                    self.store.items(resource, id), project_items(resource, json_obj)
+                )
+                # the validators of the unmerged pages go away with them
+                self.store.replace(resource, id, items)
+                state.update(resource, id, json_obj)
+                merged.add((resource, int(id)))
+
+            return merge
+
+        def since(resource: str, id: str) -> str | None:
+            """High-water mark to sync from, None when a full fetch is needed"""
+            if not delta or not self.store.has(resource, id):
+                return None
+            return state.get(resource, id)
+
+        use_graphql = config.get_graphql() and (get_assignments or get_quizzes)
+
+        def fetch_graphql_batch(batch: list[str]) -> dict[str, dict[str, Any]]:
+            """Assignments and quizzes of a batch of courses in one graphql walk,
+            falling back to the REST endpoints if graphql isn't available"""
+            try:
+                nodes = get_course_assignments(
+                    f"{domain}api/graphql", headers, [str(id) for id in batch]
+                )
+                return {
+                    id: {
+                        "assignments": to_assignments(nodes[str(id)]),
+                        "quizzes": to_quizzes(nodes[str(id)]),
+                    }
+                    for id in batch
+                }
+            except (GraphQLError, RequestError) as e:
+                Logger.info(f"Falling back to REST: {e}")
+            return {
+                id: {
+                    "assignments": get_assignments_request(
+                        f"{domain}api/v1", headers, id
+                    ),
+                    "quizzes": get_quizzes_request(f"{domain}api/v1", headers, id),
+                }
+                for id in batch
+            }
+
+        def cache_graphql_batch(results: dict[str, dict[str, Any]]):
+            for id, resources in results.items():
+                if get_assignments:
+                    cache_to("assignments", id)(resources["assignments"])
+                if get_quizzes:
+                    cache_to("quizzes", id)(resources["quizzes"])
+
+        if use_graphql:
+            batch_size = config.get_graphql_batch_size()
+            for start in range(0, len(course_ids), batch_size):
+                batch = course_ids[start : start + batch_size]
+                fetch = lambda batch=batch: fetch_graphql_batch(batch)
+                engine.add(
+                    batch,
+                    "graphql",
+                    # keep the blocking graphql walk off the event loop
+                    (
+                        (lambda fetch=fetch: asyncio.to_thread(fetch))
+                        if self.backend == "async"
+                        else fetch
+                    ),
+                    cache_graphql_batch,
+                )
+
+        for id in course_ids:
+            if get_assignments and not use_graphql:
+                # Canvas can't order assignments by updated_at, so they are
+                # always fetched whole and rely on the stored validators
+                validators = Validators(self.store.validators("assignments", id))
+                engine.add(
+                    id,
+                    "assignments",
+                    lambda id=id, validators=validators: get_assignments_request(
+                        f"{domain}api/v1", headers, id, validators, paginate
+                    ),
+                    cache_to("assignments", id, validators),
+                )
+            if get_announcements:
+                mark = since("announcements", id)
+                validators = (
+                    None
+                    if mark
+                    else Validators(self.store.validators("announcements", id))
+                )
+                engine.add(
+                    id,
+                    "announcements",
+                    lambda id=id, validators=validators, mark=mark: get_announcements_request(
+                        f"{domain}api/v1",
+                        headers,
+                        str(id),
+                        mark[:10] if mark else start_date,
+                        validators,
+                        paginate,
+                    ),
+                    (
+                        merge_into("announcements", id)
+                        if mark
+                        else cache_to("announcements", id, validators)
+                    ),
+                )
+            if get_files:
+                mark = since("files", id)
+                validators = (
+                    None if mark else Validators(self.store.validators("files", id))
+                )
+                engine.add(
+                    id,
+                    "files",
+                    lambda id=id, validators=validators, mark=mark: get_files_request(
+                        f"{domain}api/v1",
+                        headers,
+                        id,
+                        validators,
+                        updated_since=mark,
+                        paginate=paginate,
+                    ),
+                    (
+                        merge_into("files", id)
+                        if mark
+                        else cache_to("files", id, validators)
+                    ),
+                )
+            if get_quizzes and not use_graphql:
+                validators = Validators(self.store.validators("quizzes", id))
+                engine.add(
+                    id,
+                    "quizzes",
+                    lambda id=id, validators=validators: get_quizzes_request(
+                        f"{domain}api/v1", headers, id, validators, paginate
+                    ),
+                    cache_to("quizzes", id, validators),
+                )
+
+        report = engine.run()
+        state.save()
+        self.search.refresh(merged)
+        self.search.save()
+        self.terms.save(build_snapshot(self.store, self.store.courses(), term))
+        if cassette:
+            cassette.save()
+        stats.dump(f"{self.cache_dir}trace.jsonl")
+        self.cache.evict(course_ids, self.store)
+        course_names = {course["id"]: course["name"] for course in courses_info}
+        Logger.info(f"Synced {len(course_ids)} courses in {report.elapsed:.2f}s")
+        Logger.info(
+            f"{pool.stats.wire_bytes} bytes on the wire, "
+            f"{pool.stats.decoded_bytes} decoded ({pool.stats.ratio():.1f}x)"
+        )
+        Logger.info(f"Rate limit budget: {scheduler.budget()}")
+        for course_id, resource in report.failed:
+            Logger.info(f"Kept the cached {resource} of {course_names.get(course_id)}")
+        for line in report.summary(course_names):
+            Logger.info(line)
+        return report
+
+
 class Convas(object):
-    def __init__(self, stdscreen, install: str, reload: bool = False):
+    def __init__(
+        self,
+        stdscreen,
+        install: str,
+        reload: bool = False,
+        delta: bool = False,
+        backend: str = "",
+    ):
         self.term_name = install or config.get_current_term()
         if not self.term_name:
             exit()
@@ -1225,23 +1050,37 @@ class Convas(object):
         self.current_os = platform.system()
         self.cache_dir = None
         self.get_cache_dir()
+        self.syncer = CacheSync(self.cache_dir, self.term_name, backend)
+        self.store = self.syncer.store
+        self.cache = self.syncer.cache
+        self.search = self.syncer.search
+        self.terms = self.syncer.terms
+        self.downloads = DownloadStore(self.cache_dir, config.get_download_links())
+        self.course_views: OrderedDict[int, CourseSubMenu] = OrderedDict()
+        self.sync_lock = threading.Lock()
         self.url = config.get_domain()
         self.screen = stdscreen
-        self.make_api_calls(
-            get_courses=should_install,
-            get_announcements=should_install or reload,
-            get_assignments=should_install or reload,
-            get_files=should_install or reload,
-            get_quizzes=should_install or reload,
-            term_name=install,
-        )
-        self.course_info = loads(open(f"{self.cache_dir}courses.json").read())
-        self.course_names: list[str] = get_current_course_names(
-            self.course_info, self.term_name
-        )
-        self.course_ids: list[str] = get_current_course_id(
-            self.course_info, self.term_name
-        )
+        # only an install waits for the network, a reload runs in the background
+        snapshot = None if should_install else self.terms.load(self.term_name)
+        if snapshot is None:
+            self.syncer.make_api_calls(
+                get_courses=should_install,
+                get_announcements=should_install,
+                get_assignments=should_install,
+                get_files=should_install,
+                get_quizzes=should_install,
+                term_name=install,
+            )
+        self.load_snapshot(snapshot)
+        self.refresher = Refresher(
+            self.store,
+            self.course_ids,
+            self.refresh,
+            config.get_ttls(),
+            config.get_refresh_interval(),
+        ).start()
+        if reload and not should_install:
+            self.refresher.trigger(delta=delta)
         height, width = stdscreen.getmaxyx()
         self.height = height
         self.width = width
@@ -1251,6 +1090,8 @@ class Convas(object):
         self.keybind_panel = panel.new_panel(self.keybind_win)
         self.notify_win = curses.newwin(5, int(self.width * 0.3), 0, 0)
         self.notify_panel = panel.new_panel(self.notify_win)
+        self.stats_win = curses.newwin(self.height - 3, self.width, 0, 0)
+        self.stats_panel = panel.new_panel(self.stats_win)
 
         self.content_win = curses.newwin(self.height - 3, self.width, 0, 0)
         self.content_panel = panel.new_panel(self.content_win)
@@ -1281,63 +1122,6 @@ class Convas(object):
 
         self.cache_dir = cache_dir + "/"
 
-    def make_api_calls(
-        self,
-        get_courses,
-        get_assignments,
-        get_announcements,
-        get_files,
-        get_quizzes,
-        term_name="",
-    ):
-        """Method to make all api calls and cache them"""
-        domain = config.get_domain()
-
-        def write_json_to_file(filename: str, json_obj: dict[str, str]):
-            with open(filename, "w") as file:
-                file.write(dumps(json_obj))
-
-        # if the file already exists, then don't write till the user force reloads
-        if not os.path.isfile(f"{self.cache_dir}courses.json") or get_courses:
-            courses_info = get_course_info(f"{domain}api/v1/courses", headers)
-            write_json_to_file(f"{self.cache_dir}courses.json", courses_info)
-        else:
-            courses_info = loads(open(f"{self.cache_dir}courses.json").read())
-
-        course_ids: list[str] = get_current_course_id(courses_info, self.term_name)
-        if get_assignments:
-            for id in course_ids:
-                assignments = get_assignments_request(f"{domain}api/v1", headers, id)
-                write_json_to_file(f"{self.cache_dir}assignments{id}.json", assignments)
-
-        start_date = courses_info[-1]["term"]["start_at"][:10]
-        if get_announcements:
-            announcements: list[dict[str, str]] = get_announcements_request(
-                f"{domain}/api/v1", headers, course_ids, start_date
-            )
-            for id in course_ids:
-                announcement = [
-                    announcement
-                    for announcement in announcements
-                    if announcement["context_code"][7:] == str(id)
-                ]  # context_code:  "course_<id>"
-                write_json_to_file(
-                    f"{self.cache_dir}announcements{id}.json", announcement
-                )
-        if get_files:
-            for course_id in course_ids:
-                files: list[dict[str, str]] = get_files_request(
-                    f"{domain}/api/v1", headers, course_id
-                )
-                write_json_to_file(f"{self.cache_dir}files{course_id}.json", files)
-
-        if get_quizzes:
-            for course_id in course_ids:
-                quizzes: list[dict[str, str]] = get_quizzes_request(
-                    f"{domain}/api/v1", headers, course_id
-                )
-                write_json_to_file(f"{self.cache_dir}quizzes{course_id}.json", quizzes)
-
     @staticmethod
     def switch_win_callback(switch_to_statusbar: bool, statusbar: StatusBar, win: Any):
         # both win and statusbar have two virtual methods, display and run
@@ -1378,6 +1162,170 @@ class Convas(object):
         self.keybind_win.refresh()
         show_panel_hide_on_keypress(self.keybind_panel, self.keybind_win)
 
+    def show_stats(self, opts: tuple[Any, Any] = (curses.A_BOLD, curses.A_NORMAL)):
+        """Display the requests of this session per endpoint and per course
+        with self.stats_panel, slowest first"""
+        names = {str(course["id"]): course["name"] for course in self.course_info}
+        budget = scheduler.budget()
+        rows: list[tuple[str, Any]] = [("Requests by endpoint", opts[0])]
+        rows += [(line, opts[1]) for line in stats.table("endpoint")]
+        rows += [("", opts[1]), ("Requests by course", opts[0])]
+        rows += [(line, opts[1]) for line in stats.table("course_id", names)]
+        rows += [
+            ("", opts[1]),
+            (
+                f"Rate limit: {budget['remaining']} remaining, "
+                f"{budget['cost']} per request, {budget['in_flight']}/"
+                f"{budget['limit']} in flight, {budget['throttled']} throttled, "
+                f"{budget['retries']} retries",
+                opts[1],
+            ),
+            (
+                f"Transfer: {pool.stats.wire_bytes} bytes on the wire, "
+                f"{pool.stats.decoded_bytes} decoded ({pool.stats.ratio():.1f}x)",
+                opts[1],
+            ),
+        ]
+        self.show_report(rows)
+
+    def show_cache(self, opts: tuple[Any, Any] = (curses.A_BOLD, curses.A_NORMAL)):
+        """Display what the cache directory holds and its budget with
+        self.stats_panel"""
+        budget = self.cache.budget
+        rows: list[tuple[str, Any]] = [(f"Cache in {self.cache_dir}", opts[0])]
+        rows += [
+            (line, opts[1]) for line in self.cache.table(self.course_ids, self.store)
+        ]
+        rows += [
+            ("", opts[1]),
+            (
+                (
+                    f"Budget: {format_size(budget)}, least recently used evictable "
+                    "entries go first after every sync"
+                    if budget
+                    else "Budget: unlimited, set cache_budget to evict old entries"
+                ),
+                opts[1],
+            ),
+        ]
+        self.show_report(rows)
+
+    def draw_report(self, rows: list[tuple[str, Any]]) -> None:
+        self.stats_win.clear()
+        height, width = self.stats_win.getmaxyx()
+        for index, (line, attr) in enumerate(rows[: height - 2]):
+            self.stats_win.addstr(index + 1, 2, clip(line, width - 4), attr)
+        self.stats_win.border()
+        self.stats_win.refresh()
+
+    def show_report(self, rows: list[tuple[str, Any]]) -> None:
+        self.draw_report(rows)
+        show_panel_hide_on_keypress(self.stats_panel, self.stats_win)
+
+    def pick_term(self, opts: tuple[Any, Any] = (curses.A_BOLD, curses.A_NORMAL)):
+        """Choose one of the cached terms with self.stats_panel and switch to it"""
+        terms = self.terms.available()
+        if not terms:
+            self.notify("Term", "No term is cached yet, run :install first")
+            return
+        names = [term for term, _ in terms]
+        lines = [
+            f"{'*' if term == self.term_name else ' '} {term[:40]:<40} "
+            f"{entry['courses']:>3} courses, synced "
+            + time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["synced_at"]))
+            for term, entry in terms
+        ]
+        index = self.pick(
+            "Cached terms",
+            lines,
+            names.index(self.term_name) if self.term_name in names else 0,
+            opts,
+        )
+        if index is not None:
+            self.switch_term(names[index])
+
+    def pick(
+        self,
+        heading: str,
+        lines: list[str],
+        position: int = 0,
+        opts: tuple[Any, Any] = (curses.A_BOLD, curses.A_NORMAL),
+    ) -> int | None:
+        """Let the user choose one of lines with self.stats_panel, returns its
+        index or None if they closed it"""
+        show_panel(self.stats_panel)
+        height, _ = self.stats_win.getmaxyx()
+        visible = height - 5  # borders, heading, blank line and help
+        start = 0
+        while True:
+            start = min(max(start, position - visible + 1), position)
+            rows: list[tuple[str, Any]] = [(heading, opts[0])]
+            rows += [
+                (line, curses.A_REVERSE if index == position else opts[1])
+                for index, line in enumerate(
+                    lines[start : start + visible], start=start
+                )
+            ]
+            rows += [
+                ("", opts[1]),
+                ("j/k to move, enter to select, q to close", opts[1]),
+            ]
+            self.draw_report(rows)
+            key = self.stats_win.getch()
+            if key == ord("j"):
+                position = min(position + 1, len(lines) - 1)
+            elif key == ord("k"):
+                position = max(position - 1, 0)
+            elif key in (ord("q"), 27):
+                hide_panel(self.stats_panel, self.stats_win)
+                return None
+            elif key == ord("\n"):
+                hide_panel(self.stats_panel, self.stats_win)
+                return position
+
+    def search_cache(self, query: str) -> None:
+        """Find query in the cached announcements, assignments, syllabi and
+        files of the term and jump to the chosen one"""
+        if not query:
+            self.notify("Search", "usage: :search <words>")
+            return
+        start = time.perf_counter()
+        hits = self.search.search(query, self.course_ids)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not hits:
+            self.notify("Search", f"Nothing cached matches {query}")
+            return
+        codes = {course["id"]: course["course_code"] for course in self.course_info}
+        lines = [
+            f"{codes.get(hit['course_id'], '')[:12]:<12} "
+            f"{'syllabus' if hit['resource'] == 'courses' else hit['resource']:<13} "
+            f"{hit['title'][:70]:<70} {hit['score']:>5.1f}"
+            for hit in hits
+        ]
+        index = self.pick(f"{len(hits)} hits for {query} in {elapsed:.1f}ms", lines, 0)
+        if index is None:
+            return
+        hit = hits[index]
+        view = self.course_view(hit["course_id"])
+        self.status_bar.position = self.course_ids.index(hit["course_id"])
+        self.status_bar.display()
+        view.display()
+        view.jump(hit["resource"], hit["id"])
+
+    def switch_term(self, term: str) -> None:
+        """Show the courses of another cached term, from its snapshot"""
+        snapshot = self.terms.load(term)
+        if snapshot is None:
+            self.notify("Term", f"The cache of {term} is unreadable, :install it")
+            return
+        self.term_name = term
+        self.course_views.clear()
+        self.load_snapshot(snapshot)
+        # the refresher keeps syncing the configured term only, the snapshot
+        # of an archived term is never synced over
+        self.notify("Term", f"Switched to {term}, {len(self.course_ids)} courses")
+        self.run()
+
     def notify(
         self,
         heading: str,
@@ -1424,32 +1372,94 @@ class Convas(object):
         """call all api calls and cache them"""
         self.notify("Install", "sent install request", opts=(curses.A_BOLD))
         start = time.time()
-        self.make_api_calls(True, True, True, True, True)
+        with self.sync_lock:
+            self.syncer.make_api_calls(True, True, True, True, True)
         end = time.time()
-        elapsed = start - end
-        self.course_info = loads(open(f"{self.cache_dir}courses.json").read())
-        self.course_names: list[str] = get_current_course_names(self.course_info)
-        self.course_ids: list[str] = get_current_course_id(self.course_info)
+        elapsed = end - start
+        self.term_name = self.syncer.term
+        self.course_views.clear()
+        self.load_snapshot()
+        self.refresher.course_ids = self.course_ids
+        self.refresher.check()
         self.notify(
             "Install",
-            "All data has been cached in %s seconds" % elapsed,
+            "All data has been cached in %.2f seconds" % elapsed,
             opts=(curses.A_BOLD, curses.A_NORMAL),
         )
         self.run()
 
-    def reload(self):
-        self.notify("Reload", "sent reload request", opts=(curses.A_BOLD))
-        start = time.time()
-        self.make_api_calls(False, True, True, True, True)
-        end = time.time()
-        elapsed = start - end
-        self.window.clear()
+    def reload(self, delta: bool = False):
+        """Have the refresher sync everything now, the UI keeps running"""
+        self.refresher.trigger(delta=delta)
         self.notify(
             "Reload",
-            "All data has been reloaded in %s seconds" % elapsed,
+            "Reloading in the background, courses marked ~ are syncing",
             opts=(curses.A_BOLD),
         )
-        self.run()
+
+    def refresh(self, resources: set[str], delta: bool = False) -> SyncReport:
+        """Sync resources of every course, called from the refresher thread"""
+        with self.sync_lock:
+            return self.syncer.make_api_calls(
+                False,
+                "assignments" in resources,
+                "announcements" in resources,
+                "files" in resources,
+                "quizzes" in resources,
+                delta=delta,
+            )
+
+    def poll_refresh(self) -> None:
+        """Swap in what the refresher synced since the last poll, called by
+        the input loops whenever getch times out"""
+        updated = self.refresher.poll()
+        if updated is None:
+            return
+        if self.term_name != self.syncer.term:
+            return  # refreshed courses of a term that isn't shown
+        if updated:
+            self.snapshot = self.terms.load(self.term_name) or self.snapshot
+        for course_id in updated:
+            if course_id in self.course_views:
+                self.course_views[course_id].invalidate(
+                    self.snapshot["views"].get(course_id)
+                )
+        self.status_bar.display()
+
+    def load_snapshot(self, snapshot: dict[str, Any] | None = None) -> None:
+        """Take the courses of the term and their rendered views from the
+        snapshot of the last sync, building it from the store if it's unusable"""
+        self.snapshot = snapshot or self.terms.load(self.term_name)
+        if self.snapshot is None:
+            self.snapshot = build_snapshot(
+                self.store, self.store.courses(), self.term_name
+            )
+        self.course_info = self.snapshot["courses"]
+        self.course_names: list[str] = self.snapshot["names"]
+        self.course_ids: list[str] = self.snapshot["ids"]
+
+    def course_view(self, course_id: int) -> CourseSubMenu:
+        """The CourseSubMenu of course_id, reused (with its loaded tabs and
+        position) while it is among the most recently opened courses"""
+        view = self.course_views.pop(course_id, None)
+        if view is None:
+            view = CourseSubMenu(
+                self.store,
+                self.downloads,
+                self.content_win,
+                course_id,
+                [course for course in self.course_info if course["id"] == course_id][0],
+                lambda win: self.switch_win_callback(True, self.status_bar, win),
+                lambda: self.status_bar.gutter_mode(),
+                self.set_keybind_help,
+                self.notify,
+                self.poll_refresh,
+                self.snapshot["views"].get(course_id),
+            )
+        self.course_views[course_id] = view
+        while len(self.course_views) > config.get_course_views():
+            self.course_views.popitem(last=False)
+        return view
 
     def run(self) -> None:
         curses.curs_set(0)
@@ -1458,18 +1468,11 @@ class Convas(object):
             self.height,
             self.width,
             self.course_ids,
-            lambda course_id: CourseSubMenu(
-                self.cache_dir,
-                self.content_win,
-                course_id,
-                [course for course in self.course_info if course["id"] == course_id][0],
-                lambda win: self.switch_win_callback(True, self.status_bar, win),
-                self.status_bar.gutter_mode,
-                self.set_keybind_help,
-                self.notify,
-            ),
+            self.course_view,
             self.switch_win_callback,
             self.set_keybind_help,
+            self.refresher.state,
+            self.poll_refresh,
         )
         self.status_bar.add_cmd("quit", exit, alias="q")
         self.status_bar.add_cmd(
@@ -1479,6 +1482,11 @@ class Convas(object):
         )
         self.status_bar.add_cmd("install", self.install)
         self.status_bar.add_cmd("reload", self.reload)
+        self.status_bar.add_cmd("delta", lambda: self.reload(delta=True))
+        self.status_bar.add_cmd("stats", self.show_stats)
+        self.status_bar.add_cmd("cache", self.show_cache)
+        self.status_bar.add_cmd("term", self.pick_term)
+        self.status_bar.add_cmd("search", self.search_cache)
 
         splash = r"""
         Convas - The CONsole client for canVAS
@@ -1486,6 +1494,12 @@ class Convas(object):
         type    :help<CR>    for keybind help
         type    :install<CR> to cache all courses (one time)
         type    :reload<CR> to reload all course information
+                    (courses marked * are stale, ~ are syncing)
+        type    :delta<CR>  to fetch only what changed since the last sync
+        type    :stats<CR>  to see where the sync time went
+        type    :cache<CR>  to see where the disk space went
+        type    :term<CR>   to switch to another cached term
+        type    :search <words><CR> to search the cached courses
         """
 
         try:
@@ -1519,11 +1533,30 @@ def main(stdscr):
         "--reload",
         "-r",
         action="store_true",
-        help="Reload all course data",
+        help="Reload all course data in the background",
+    )
+    parser.add_argument(
+        "--delta",
+        "-d",
+        action="store_true",
+        help="With --reload, only fetch what changed since the last sync",
+    )
+    parser.add_argument(
+        "--backend",
+        "-b",
+        choices=["thread", "async"],
+        default="",
+        help="Fetch with a pool of threads (default) or with asyncio",
     )
     args = parser.parse_args()
     curses.use_default_colors()
-    convas = Convas(stdscr, install=args.install, reload=args.reload)
+    convas = Convas(
+        stdscr,
+        install=args.install,
+        reload=args.reload,
+        delta=args.delta,
+        backend=args.backend,
+    )
     convas.run()
 
 
@@ -1,64 +1,364 @@
 #!/usr/bin/env python3
 
 # pyright: reportUnknownVariableType=false
+import hashlib
 import json
 import os
-from typing import assert_never
-from urllib import error, request
-from urllib.error import HTTPError
-from urllib.request import Request
-from http.client import HTTPResponse
+import time
+from typing import Any, Callable, Generator, assert_never
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from helper import Logger
+from scheduler import RequestError, scheduler
+from stats import RequestRecord, stats
+from transport import CHUNK_SIZE, Response, pool
 
 HOME = os.path.expanduser("~")
 CONFIG_FILE = "%s/.config/convas/config" % HOME
 
+page_workers = 4
+page_executor: ThreadPoolExecutor | None = None
+page_executor_lock = threading.Lock()
+
+
+def parse_link_header(value: str | None) -> dict[str, str]:
+    """Map the rels of a Link header (current, next, last, ...) to their urls"""
+    links: dict[str, str] = {}
+    if not value:
+        return links
+    for link in value.split(","):
+        link = link.split(";")
+        if len(link) < 2:
+            continue
+        rel = link[1].split("=")
+        if len(rel) == 2:
+            links[rel[1].strip().strip('"')] = link[0].strip().strip("<>")
+    return links
+
+
+def get_page_number(url: str) -> int | None:
+    """Numeric page= parameter of url, None for bookmark style cursors"""
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key == "page":
+            return int(value) if value.isdigit() else None
+    return None
+
+
+def get_remaining_pages(links: dict[str, str]) -> list[str] | None:
+    """Urls of every page after the current one, if they can be computed from
+    the "last" link; otherwise the pages have to be walked one by one"""
+    if "last" not in links or "current" not in links:
+        return None
+    current = get_page_number(links["current"])
+    last = get_page_number(links["last"])
+    if current is None or last is None:
+        return None
+    parts = urlsplit(links["last"])
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != "page"]
+    return [
+        urlunsplit(parts._replace(query=urlencode(query + [("page", str(page))])))
+        for page in range(current + 1, last + 1)
+    ]
+
+
+def set_page_concurrency(workers: int) -> None:
+    global page_workers, page_executor
+    with page_executor_lock:
+        page_workers = max(1, workers)
+        if page_executor is not None:
+            page_executor.shutdown(wait=False)
+        page_executor = None
+
+
+def get_page_executor() -> ThreadPoolExecutor:
+    global page_executor
+    with page_executor_lock:
+        if page_executor is None:
+            page_executor = ThreadPoolExecutor(max_workers=page_workers)
+        return page_executor
+
+
+class Page:
+    """One page of a paginated endpoint, either fresh or reused from the cache"""
+
+    def __init__(
+        self,
+        url: str,
+        items: list[str],
+        link: str | None,
+        etag: str | None,
+        last_modified: str | None,
+        not_modified: bool = False,
+        bytes: int = 0,
+        retries: int = 0,
+        cost: float = 0.0,
+    ):
+        self.url = url
+        self.items = items
+        self.link = link
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+        self.bytes = bytes
+        self.retries = retries
+        self.cost = cost
+
+
+class Validators:
+    """Validators of the pages a cached payload came from, sent along with
+    the requests of its next fetch.
+
+    The fetch keeps the pages it got in fetched rather than storing their
+    validators itself: the caller stores them once the items are cached,
+    so they never describe items that didn't get written."""
+
+    def __init__(self, pages: list[dict[str, Any]] | None = None):
+        self.pages = pages or []
+        self.fetched: list[Page] | None = None
+
+    def get(self, index: int) -> dict[str, Any] | None:
+        return self.pages[index] if index < len(self.pages) else None
+
+    def records(self) -> list[dict[str, Any]] | None:
+        """The validators of the fetched pages with the positions of the items
+        each one produced, None if there is nothing to revalidate with"""
+        records = []
+        start = 0
+        for page in self.fetched or []:
+            end = start + len(page.items)
+            records.append(
+                {
+                    "url": page.url,
+                    "etag": page.etag,
+                    "last_modified": page.last_modified,
+                    "link": page.link,
+                    "start": start,
+                    "end": end,
+                }
+            )
+            start = end
+        if not any(record["etag"] or record["last_modified"] for record in records):
+            return None
+        return records
+
+    def unchanged(self) -> set[Any]:
+        """Ids of the items of the fetched pages answered with a 304"""
+        return {
+            item["id"]
+            for page in self.fetched or []
+            if page.not_modified
+            for item in page.items
+        }
+
+
+def conditional_headers(
+    url: str, headers: dict[str, str], validator: dict[str, Any] | None
+) -> dict[str, str]:
+    request_headers = dict(headers)
+    if validator:
+        if validator.get("etag"):
+            request_headers["If-None-Match"] = validator["etag"]
+        # Last-Modified only describes the exact url it came from, an ETag
+        # identifies the page content even if the query changed
+        if validator.get("last_modified") and validator.get("url") == url:
+            request_headers["If-Modified-Since"] = validator["last_modified"]
+    return request_headers
+
+
+def is_disabled_tab(response: Response) -> bool:
+    """Canvas answers the request of a student for a tab the teacher disabled
+    with a 401 "unauthorized" status, while a token that expired or is invalid
+    gets a 401 with a WWW-Authenticate challenge"""
+    return (
+        response.getcode() == 401
+        and response.getheader("www-authenticate") is None
+        and b'"unauthorized"' in response.read()
+    )
+
+
+def parse_page(
+    url: str, response: Response, validator: dict[str, Any] | None = None
+) -> Page | None:
+    status_code: int = response.getcode()
+    cost = {
+        "bytes": response.wire_bytes,
+        "retries": response.retries,
+        "cost": float(response.getheader("x-request-cost") or 0),
+    }
+    if status_code == 304 and validator:
+        return Page(
+            url,
+            validator["items"],
+            response.getheader("link") or validator.get("link"),
+            response.getheader("etag") or validator.get("etag"),
+            response.getheader("last-modified") or validator.get("last_modified"),
+            not_modified=True,
+            **cost,
+        )
+    if status_code == 404 or is_disabled_tab(response):
+        return None
+    elif status_code != 200:
+        # an expired token, a forbidden course, ... must not read as a
+        # resource without items and wipe its cache
+        raise RequestError(f"Error fetching data: {status_code} {url}")
+    return Page(
+        url,
+        json.loads(response.read().decode("utf-8")),
+        response.getheader("link"),
+        response.getheader("etag"),
+        response.getheader("last-modified"),
+        **cost,
+    )
 
-def get_paginated_responses(url: str, headers: dict[str, str]) -> list[str] | None:
-    next_page: str = url
+
+def get_page(
+    url: str, headers: dict[str, str], validator: dict[str, Any] | None = None
+) -> Page | None:
+    request_headers = conditional_headers(url, headers, validator)
+    response: Response = scheduler.request(lambda: pool.request(url, request_headers))
+    return parse_page(url, response, validator)
+
+
+# A paginated call is written once, as a walk: a generator that yields the
+# requests it needs next, as (url, validator) pairs, and is sent back their
+# pages. run_walk drives it with blocking requests and the async backend
+# with coroutines, so both walk pages the same way.
+Walk = Generator[list[tuple[str, dict[str, Any] | None]], list[Page | None], Any]
+
+
+def walk_pages(url: str, validators: Validators) -> Walk:
+    """Every page of url, the ones after the first requested together when
+    the Link header tells how many there are"""
+    (page,) = yield [(url, validators.get(0))]
+    if page is None:
+        return None
+    pages: list[Page] = [page]
+    links = parse_link_header(page.link)
+
+    remaining = get_remaining_pages(links)
+    if remaining is not None:
+        fetched = yield [
+            (page_url, validators.get(index))
+            for index, page_url in enumerate(remaining, start=1)
+        ]
+        if any(page is None for page in fetched):
+            return None
+        pages.extend(fetched)
+    else:
+        while links.get("next"):
+            (page,) = yield [(links["next"], validators.get(len(pages)))]
+            if page is None:
+                return None
+            pages.append(page)
+            links = parse_link_header(page.link)
+    return pages
+
+
+def walk_pages_until(url: str, stop_when: Callable[[Any], bool]) -> Walk:
+    """Pages of url in order until one holds an item matching stop_when,
+    with the items before that point"""
+    pages: list[Page] = []
     data: list[str] = []
+    next_page: str | None = url
     while next_page:
-        req: Request = Request(next_page, headers=headers)
-        try:
-            response: HTTPResponse = request.urlopen(req)
-        except HTTPError as e:
-            Logger.info(f"Error fetching data: {e}")
-            return
-        status_code: int = response.getcode()
-        if status_code == 404:
-            return None
-        elif status_code != 200:
-            print(f"Error fetching data: {status_code}")
-            exit()
-
-        response_data: dict[str, str] = json.loads(response.read().decode("utf-8"))
-        data.extend(response_data)
-
-        res_h = response.getheaders()
-        response.close()
-        for header in res_h:
-            if header[0] == "link":
-                links = header[1]
-                links = links.split(",")
-                current_page = ""
-                last_page = ""
-                for link in links:
-                    link = link.split(";")
-                    is_next = link[1].split("=")
-                    if is_next[1] == '"current"':
-                        current_page = link[0].strip().strip("<>")
-                    if is_next[1] == '"next"':
-                        next_page = link[0].strip("<>")
-                    if is_next[1] == '"last"':
-                        last_page = link[0].strip("<>")
-                        if current_page == last_page:
-                            return data
-                break
+        (page,) = yield [(next_page, None)]
+        if page is None:
+            return None, data
+        pages.append(page)
+        for item in page.items:
+            if stop_when(item):
+                return pages, data
+            data.append(item)
+        next_page = parse_link_header(page.link).get("next")
+    return pages, data
+
+
+def walk_paginated(
+    url: str,
+    validators: Validators | None = None,
+    stop_when: Callable[[Any], bool] | None = None,
+) -> Walk:
+    """The walk of get_paginated_responses, recording what it cost"""
+    started = time.perf_counter()
+    try:
+        if stop_when is not None:
+            pages, data = yield from walk_pages_until(url, stop_when)
+        else:
+            pages = yield from walk_pages(url, validators or Validators())
+            data = [item for page in pages or [] for item in page.items]
+    except RequestError:
+        record_request(url, started, None)
+        raise
+    record_request(url, started, pages)
+    if pages is None:
+        return None
+
+    if validators is not None and stop_when is None:
+        unchanged = sum(page.not_modified for page in pages)
+        Logger.info(f"{unchanged}/{len(pages)} pages not modified for {url}")
+        validators.fetched = pages
     return data
 
 
+def run_walk(walk: Walk, headers: dict[str, str]) -> Any:
+    """Drive walk with blocking requests, the ones it asks for together on
+    the page executor"""
+    try:
+        requests = next(walk)
+        while True:
+            try:
+                if len(requests) == 1:
+                    url, validator = requests[0]
+                    pages = [get_page(url, headers, validator)]
+                else:
+                    pages = list(
+                        get_page_executor().map(
+                            lambda request: get_page(request[0], headers, request[1]),
+                            requests,
+                        )
+                    )
+            except RequestError as e:
+                requests = walk.throw(e)
+            else:
+                requests = walk.send(pages)
+    except StopIteration as done:
+        return done.value
+
+
+def get_paginated_responses(
+    url: str,
+    headers: dict[str, str],
+    validators: Validators | None = None,
+    stop_when: Callable[[Any], bool] | None = None,
+) -> list[str] | None:
+    """Fetch every page of url. With validators, they are sent along, pages
+    answered with 304 reuse the cached items and the pages fetched are kept
+    in validators.fetched. With stop_when, pages are walked in order until a
+    page holds an item matching it, and only the items before that point
+    are returned"""
+    return run_walk(walk_paginated(url, validators, stop_when), headers)
+
+
+def record_request(url: str, started: float, pages: list[Page] | None) -> None:
+    """Add what one paginated call cost to the request stats, pages is None
+    when the call failed"""
+    stats.add(
+        RequestRecord(
+            url,
+            time.perf_counter() - started,
+            pages=len(pages or []),
+            bytes=sum(page.bytes for page in pages or []),
+            retries=sum(page.retries for page in pages or []),
+            not_modified=sum(page.not_modified for page in pages or []),
+            cost=sum(page.cost for page in pages or []),
+            ok=pages is not None,
+        )
+    )
+
+
 def get_course_names(json_obj: list[dict[str, str]]) -> list[str]:
     return [course["name"] for course in json_obj]
 
@@ -100,23 +400,26 @@ def get_current_course_id(json_obj: list[dict[str, str]], term: str) -> list[str
     return [course["id"] for course in json_obj if course["term"]["name"] == term]
 
 
-def get_request(url: str, request_headers: dict[str, str]) -> HTTPResponse:
-    res: HTTPResponse = request.urlopen(url, headers=request_headers)
-    assert isinstance(res, HTTPResponse)
-    return res
+def get_request(url: str, request_headers: dict[str, str]) -> Response:
+    return pool.request(url, request_headers)
 
 
 def get_todo_items(
     url: str, headers: dict[str, str], course_id: int
 ) -> list[str] | None:
-    req: list[str] = request.urlopen(f"{url}/{course_id}/todo", headers=headers)
-    return req
+    return get_paginated_responses(f"{url}/{course_id}/todo", headers)
 
 
-def get_course_info(url: str, headers: dict):
-    courses = get_paginated_responses(
+def get_course_info(
+    url: str,
+    headers: dict,
+    validators: Validators | None = None,
+    paginate: Callable[..., Any] = get_paginated_responses,
+):
+    courses = paginate(
         f"{url}?per_page=60&enrollment_type=student&include[]=syllabus_body&include[]=total_scores&include[]=public_description&include[]=course_progress&include[]=sections&include[]=teachers&include[]=term&include[]=favorites",
         headers,
+        validators,
     )
     return courses
 
@@ -133,48 +436,93 @@ def get_files(url: str, headers: dict[str, str], course_id: int) -> list[str] |
 
 def download_file(
     url: str, id: int, course_id: int, outfile: str, headers: dict[str, str]
-) -> bool:
+) -> str | None:
+    """Stream a file to outfile, returns the sha256 of its content or None
+    if the download failed"""
+    partial = f"{outfile}.part"
     try:
-        with request.urlopen(url) as response:
-            with open(outfile, "wb") as out_file:
-                out_file.write(response.read())
-                return True
-    except error.URLError as err:
+        with pool.open(url, headers) as response:
+            if response.status != 200:
+                Logger.info(f"Failed to download file. Status {response.status}")
+                return None
+            digest = hashlib.sha256()
+            with open(partial, "wb") as out_file:
+                while chunk := response.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out_file.write(chunk)
+        os.replace(partial, outfile)
+        return digest.hexdigest()
+    except (OSError, RequestError) as err:
         Logger.info(f"Failed to download file. Exception {err}")
-        return False
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
 
 
-def get_assignments_request(url: str, headers: dict[str, str], course_id: int):
-    assignments = get_paginated_responses(
-        f"{url}/courses/{course_id}/assignments", headers
+def get_assignments_request(
+    url: str,
+    headers: dict[str, str],
+    course_id: int,
+    validators: Validators | None = None,
+    paginate: Callable[..., Any] = get_paginated_responses,
+):
+    assignments = paginate(
+        f"{url}/courses/{course_id}/assignments", headers, validators
     )
     return assignments
 
 
 def get_announcements_request(
-    url: str, headers: dict[str, str], course_id: list[str] | str, start_date: str
+    url: str,
+    headers: dict[str, str],
+    course_id: list[str] | str,
+    start_date: str,
+    validators: Validators | None = None,
+    paginate: Callable[..., Any] = get_paginated_responses,
 ):
     if isinstance(course_id, str):
-        current_timestamp = datetime.now().strftime("%Y:%m:%d")
-        announcements: list[dict[str, str]] = get_paginated_responses(
-            f"{url}/announcements?context_codes[]=course_{course_id}&start_date={start_date}&end_date={current_timestamp}"
+        current_timestamp = datetime.now().strftime("%Y-%m-%d")
+        announcements: list[dict[str, str]] = paginate(
+            f"{url}/announcements?context_codes[]=course_{course_id}&start_date={start_date}&end_date={current_timestamp}",
+            headers,
+            validators,
         )
     elif isinstance(course_id, list):
         query_params = ""
         for course in course_id:
             query_params += f"context_codes[]=course_{course}&"
         query_params += f"start_date={start_date}"
-        announcements = get_paginated_responses(
-            f"{url}/announcements?{query_params}", headers
+        announcements = paginate(
+            f"{url}/announcements?{query_params}", headers, validators
         )
     return announcements
 
 
-def get_files_request(url: str, headers: dict[str, str], course_id: int):
-    files = get_paginated_responses(f"{url}/courses/{course_id}/files", headers)
+def get_files_request(
+    url: str,
+    headers: dict[str, str],
+    course_id: int,
+    validators: Validators | None = None,
+    updated_since: str | None = None,
+    paginate: Callable[..., Any] = get_paginated_responses,
+):
+    if updated_since:
+        # newest first, so the walk can stop at the first file we already have
+        return paginate(
+            f"{url}/courses/{course_id}/files?sort=updated_at&order=desc",
+            headers,
+            stop_when=lambda file: file["updated_at"] <= updated_since,
+        )
+    files = paginate(f"{url}/courses/{course_id}/files", headers, validators)
     return files
 
 
-def get_quizzes_request(url: str, headers: dict[str, str], course_id: int):
-    quizzes = get_paginated_responses(f"{url}/courses/{course_id}/quizzes", headers)
+def get_quizzes_request(
+    url: str,
+    headers: dict[str, str],
+    course_id: int,
+    validators: Validators | None = None,
+    paginate: Callable[..., Any] = get_paginated_responses,
+):
+    quizzes = paginate(f"{url}/courses/{course_id}/quizzes", headers, validators)
     return quizzes
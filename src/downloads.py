@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from cache import CacheBudget
+from convas_requests import download_file
+from helper import Logger, atomic_write
+
+# linux ioctl making a file share the blocks of another (a reflink), on file
+# systems that support it like btrfs and xfs
+FICLONE = 0x40049409
+
+
+def copy(source: str, destination: str) -> None:
+    """Copy source to destination, as a reflink where the file system can"""
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfileobj(src, dst)
+
+
+class DownloadStore:
+    """Downloaded Canvas files, content addressed under <cache_dir>/downloads.
+
+    objects/<ab>/<sha256> holds every distinct content once, private to the
+    user and read only; index.json maps a version of a file, its id,
+    updated_at and size, to the hash of its content. Downloading a version
+    fetched before copies it from the store without touching the network,
+    and an attachment shared by several courses or sections is stored once
+    whatever its file id. The copy is a file of its own to edit or annotate,
+    sharing its blocks with the store where the file system allows it. With
+    link, downloads are hardlinks to the stored content instead, read only,
+    and content that no longer looks like what was downloaded, made writable
+    or resized, is fetched again."""
+
+    def __init__(self, cache_dir: str, link: bool = False):
+        self.dir = os.path.join(cache_dir, "downloads")
+        self.objects = os.path.join(self.dir, "objects")
+        self.filename = os.path.join(self.dir, "index.json")
+        self.link = link
+        os.makedirs(self.objects, stat.S_IRWXU, exist_ok=True)
+        self.index: dict[str, str] = self.read()
+
+    def read(self) -> dict[str, str]:
+        try:
+            with open(self.filename) as file:
+                return json.loads(file.read())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(file: dict[str, Any]) -> str:
+        return f"{file['id']}:{file.get('updated_at')}:{file.get('size')}"
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def lookup(self, file: dict[str, Any]) -> str | None:
+        """The stored content of this version of file, if it was downloaded
+        and hasn't been evicted since"""
+        digest = self.index.get(self.key(file))
+        if digest is None:
+            return None
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            return None
+        if not self.intact(path, file):
+            Logger.info(f"Stored {file.get('display_name')} was modified, refetching")
+            os.remove(path)
+            return None
+        return path
+
+    @staticmethod
+    def intact(path: str, file: dict[str, Any]) -> bool:
+        """Whether the content at path can still be the one downloaded for
+        file: read only and of the size Canvas reports"""
+        try:
+            info = os.stat(path)
+        except OSError:
+            return False
+        if info.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH):
+            return False
+        return file.get("size") is None or info.st_size == file["size"]
+
+    def add(
+        self, file: dict[str, Any], course_id: int, url: str, headers: dict[str, str]
+    ) -> str | None:
+        """Download file into the store, returns the path of its content"""
+        fd, tmp = tempfile.mkstemp(dir=self.dir, prefix=".", suffix=".download")
+        os.close(fd)
+        digest = download_file(url, file["id"], course_id, tmp, headers)
+        if digest is None:
+            os.remove(tmp)
+            return None
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp)  # the same content under another id or version
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp, stat.S_IRUSR)
+            os.replace(tmp, path)
+        self.index[self.key(file)] = digest
+        self.save()
+        return path
+
+    def save(self) -> None:
+        # forget the versions whose content was evicted
+        self.index = {
+            key: digest
+            for key, digest in self.index.items()
+            if os.path.exists(self.object_path(digest))
+        }
+        atomic_write(self.filename, json.dumps(self.index))
+
+    def export(self, path: str, outfile: str) -> str:
+        """Put the stored content at path at outfile, as a copy or with link
+        as a hardlink, copying it anyway if the two are on different file
+        systems. Returns "linked" or "copied" as it did"""
+        if self.link and os.path.exists(outfile) and os.path.samefile(path, outfile):
+            return "linked"
+        tmp = f"{outfile}.part"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        exported = "copied"
+        if self.link:
+            try:
+                os.link(path, tmp)
+                exported = "linked"
+            except OSError:
+                pass
+        if exported == "copied":
+            copy(path, tmp)
+        os.replace(tmp, outfile)
+        return exported
+
+    def get(
+        self,
+        file: dict[str, Any],
+        course_id: int,
+        url: str,
+        outfile: str,
+        headers: dict[str, str],
+    ) -> str | None:
+        """Put file at outfile, returns "linked" or "copied" if it came from
+        the store, "downloaded" if it had to be fetched, None on failure"""
+        path = self.lookup(file)
+        cached = path is not None
+        if path is None:
+            path = self.add(file, course_id, url, headers)
+            if path is None:
+                return None
+        else:
+            CacheBudget.touch(path)
+        try:
+            exported = self.export(path, outfile)
+        except OSError as err:
+            Logger.info(f"Failed to save {outfile}: {err}")
+            return None
+        return exported if cached else "downloaded"
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+"""A local stand-in for the parts of the Canvas API that convas uses.
+
+Serves synthetic (or recorded) courses, assignments, files, quizzes and
+announcements with Link pagination, ETags, gzip, latency and a Canvas
+style rate limit bucket, so syncs can be measured without a school token:
+
+    src/fake_canvas.py --port 8000 --courses 7 --latency 0.05
+
+and in ~/.config/convas/config
+
+    TOKEN=fake
+    domain=http://127.0.0.1:8000/
+    term=Fake Term
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit
+
+from transport import Cassette
+
+TERM = "Fake Term"
+
+
+def timestamp(days: float) -> str:
+    start = datetime(2024, 1, 8, tzinfo=timezone.utc)
+    return (start + timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeCanvas:
+    """Synthetic course data, generated deterministically from a seed"""
+
+    def __init__(
+        self,
+        courses: int = 7,
+        assignments: int = 40,
+        files: int = 120,
+        quizzes: int = 10,
+        announcements: int = 25,
+        term: str = TERM,
+        seed: int = 0,
+        past_terms: int = 0,
+    ):
+        rand = random.Random(seed)
+        self.courses: list[dict[str, Any]] = []
+        self.resources: dict[tuple[str, int], list[dict[str, Any]]] = {}
+        # courses of past terms come first, like Canvas lists them
+        for index in range(courses * (past_terms + 1)):
+            course_id = 1000 + index
+            past = past_terms - index // courses
+            term_name = f"Past Term {past}" if past else term
+            code = f"CS {100 + index * 11}"
+            self.courses.append(
+                {
+                    "id": course_id,
+                    "name": f"{code} Course {index} (Section 1)",
+                    "course_code": code,
+                    "syllabus_body": "<p>"
+                    + "Welcome to the course. " * rand.randint(5, 40)
+                    + "</p>",
+                    "term": {"name": term_name, "start_at": timestamp(-120 * past)},
+                    "teachers": [{"display_name": f"Professor {index}"}],
+                    "enrollments": [
+                        {
+                            "type": "student",
+                            "computed_current_score": rand.randint(60, 100),
+                        }
+                    ],
+                }
+            )
+            self.resources["assignments", course_id] = [
+                {
+                    "id": course_id * 1000 + i,
+                    "name": f"Assignment {i}",
+                    "description": "<p>"
+                    + "Do the work. " * rand.randint(10, 200)
+                    + "</p>",
+                    "html_url": f"/courses/{course_id}/assignments/{i}",
+                    "points_possible": rand.choice([10, 20, 50, 100]),
+                    "created_at": timestamp(i),
+                    "updated_at": timestamp(i + rand.random()),
+                    "due_at": timestamp(i + 7),
+                }
+                for i in range(assignments)
+            ]
+            self.resources["files", course_id] = [
+                {
+                    "id": course_id * 10000 + i,
+                    "display_name": f"lecture-{i}.pdf",
+                    "mime_class": "pdf",
+                    # the same lecture in every course, to share attachments
+                    "size": 10_000 + i * 2_000,
+                    "url": f"/files/{course_id * 10000 + i}/download",
+                    "created_at": timestamp(i / 2),
+                    "updated_at": timestamp(i / 2 + rand.random()),
+                }
+                for i in range(files)
+            ]
+            self.resources["quizzes", course_id] = [
+                {
+                    "id": course_id * 100 + i,
+                    "title": f"Quiz {i}",
+                    "html_url": f"/courses/{course_id}/quizzes/{i}",
+                    "due_at": timestamp(i * 7),
+                    "updated_at": timestamp(i * 7),
+                }
+                for i in range(quizzes)
+            ]
+            self.resources["announcements", course_id] = [
+                {
+                    "id": course_id * 100 + i,
+                    "title": f"Announcement {i}",
+                    "message": "<p>" + "Class update. " * rand.randint(5, 60) + "</p>",
+                    "user_name": f"Professor {index}",
+                    "created_at": timestamp(i * 3),
+                    "updated_at": timestamp(i * 3),
+                    "context_code": f"course_{course_id}",
+                }
+                # newest first, like Canvas lists them
+                for i in reversed(range(announcements))
+            ]
+
+    def download(self, path: str) -> bytes | None:
+        """Content of a /files/<id>/download url, the same for files of the
+        same name and size"""
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "files" or not parts[1].isdigit():
+            return None
+        file_id = int(parts[1])
+        for file in self.resources.get(("files", file_id // 10000), []):
+            if file["id"] == file_id:
+                line = f"%PDF-1.4 {file['display_name']}\n".encode()
+                return (line * (file["size"] // len(line) + 1))[: file["size"]]
+        return None
+
+    def lookup(self, path: str, query: dict[str, list[str]]) -> list[dict] | None:
+        parts = path.strip("/").split("/")
+        if parts == ["api", "v1", "courses"]:
+            return self.courses
+        if parts[:2] == ["api", "v1"] and parts[2:3] == ["announcements"]:
+            ids = [int(code[7:]) for code in query.get("context_codes[]", [])]
+            start = query.get("start_date", [""])[0]
+            return [
+                announcement
+                for id in ids
+                for announcement in self.resources.get(("announcements", id), [])
+                if announcement["created_at"][:10] >= start
+            ]
+        if len(parts) == 5 and parts[2] == "courses" and parts[3].isdigit():
+            items = self.resources.get((parts[4], int(parts[3])))
+            if items is not None and query.get("sort") == ["updated_at"]:
+                reverse = query.get("order") == ["desc"]
+                items = sorted(
+                    items, key=lambda item: item["updated_at"], reverse=reverse
+                )
+            return items
+        return None
+
+
+class RateLimit:
+    """Canvas style leaky bucket, throttling with 403 once it runs dry"""
+
+    def __init__(self, capacity: float, refill: float, cost: float):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.remaining = capacity
+        self.refill = refill
+        self.cost = cost
+        self.updated = time.time()
+
+    def spend(self) -> tuple[bool, float]:
+        with self.lock:
+            now = time.time()
+            self.remaining = min(
+                self.capacity, self.remaining + (now - self.updated) * self.refill
+            )
+            self.updated = now
+            if self.remaining < self.cost:
+                return False, self.remaining
+            self.remaining -= self.cost
+            return True, self.remaining
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeCanvasServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        if "gzip" in (self.headers.get("Accept-Encoding") or "") and len(body) > 256:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        server = self.server
+        time.sleep(server.latency * (0.5 + random.random()))
+        server.requests += 1
+
+        if server.token and self.headers.get("Authorization") != (
+            f"Bearer {server.token}"
+        ):
+            self.send_body(
+                401,
+                b'{"errors":[{"message":"Invalid access token."}]}',
+                {"WWW-Authenticate": 'Bearer realm="canvas-lms"'},
+            )
+            return
+
+        allowed, remaining = server.rate_limit.spend()
+        rate_headers = {
+            "X-Rate-Limit-Remaining": f"{remaining:.1f}",
+            "X-Request-Cost": f"{server.rate_limit.cost:.1f}",
+        }
+        if not allowed or random.random() < server.throttle:
+            server.throttled += 1
+            self.send_body(403, b"403 Forbidden (Rate Limit Exceeded)", rate_headers)
+            return
+
+        if server.cassette is not None:
+            recorded = server.cassette.find("GET", self.path)
+            if recorded is None:
+                self.send_body(404, b'{"errors":[]}', rate_headers)
+                return
+            status, headers, body = recorded
+            self.send_body(status, body, {**dict(headers), **rate_headers})
+            return
+
+        parts = urlsplit(self.path)
+        content = server.canvas.download(parts.path)
+        if content is not None:
+            headers = {"Content-Type": "application/octet-stream", **rate_headers}
+            self.send_body(200, content, headers)
+            return
+        query = parse_qs(parts.query)
+        items = server.canvas.lookup(parts.path, query)
+        if items is None:
+            self.send_body(404, b'{"errors":[{"message":"not found"}]}', rate_headers)
+            return
+
+        per_page = int(query.get("per_page", [server.per_page])[0])
+        page = int(query.get("page", ["1"])[0])
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        body = json.dumps(items[(page - 1) * per_page : page * per_page]).encode()
+
+        def page_url(number: int) -> str:
+            params = [
+                (key, value) for key, value in parse_qsl(parts.query) if key != "page"
+            ]
+            params += [("page", str(number)), ("per_page", str(per_page))]
+            host = self.headers.get("Host")
+            return f"<http://{host}{parts.path}?{urlencode(params)}>"
+
+        links = [f'{page_url(page)}; rel="current"']
+        if page < last:
+            links.append(f'{page_url(page + 1)}; rel="next"')
+        if page > 1:
+            links.append(f'{page_url(page - 1)}; rel="prev"')
+        links.append(f'{page_url(1)}; rel="first"')
+        links.append(f'{page_url(last)}; rel="last"')
+
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = {
+            **rate_headers,
+            "Content-Type": "application/json; charset=utf-8",
+            "Link": ",".join(links),
+            "ETag": etag,
+        }
+        if self.headers.get("If-None-Match") == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_body(200, body, headers)
+
+
+class FakeCanvasServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        canvas: FakeCanvas,
+        latency: float = 0.0,
+        per_page: int = 10,
+        throttle: float = 0.0,
+        rate_limit: RateLimit | None = None,
+        cassette: Cassette | None = None,
+        verbose: bool = False,
+        token: str | None = None,
+    ):
+        super().__init__(address, Handler)
+        self.canvas = canvas
+        self.latency = latency
+        self.per_page = per_page
+        self.throttle = throttle
+        self.rate_limit = rate_limit or RateLimit(700, 10, 1)
+        self.cassette = cassette
+        self.verbose = verbose
+        # the only token accepted, any token goes if None
+        self.token = token
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+
+    def start(self) -> "FakeCanvasServer":
+        """Serve from a background thread, for use from scripts"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Canvas API")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--courses", type=int, default=7)
+    parser.add_argument("--assignments", type=int, default=40)
+    parser.add_argument("--files", type=int, default=120)
+    parser.add_argument("--quizzes", type=int, default=10)
+    parser.add_argument("--announcements", type=int, default=25)
+    parser.add_argument("--term", default=TERM)
+    parser.add_argument(
+        "--past-terms", type=int, default=0, help="terms of older courses"
+    )
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument(
+        "--throttle", type=float, default=0.0, help="chance of a random 403"
+    )
+    parser.add_argument("--bucket", type=float, default=700, help="rate limit bucket")
+    parser.add_argument("--refill", type=float, default=10, help="bucket refill/s")
+    parser.add_argument("--cost", type=float, default=1, help="cost of a request")
+    parser.add_argument("--cassette", help="serve responses recorded by convas")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeCanvasServer(
+        ("127.0.0.1", args.port),
+        FakeCanvas(
+            args.courses,
+            args.assignments,
+            args.files,
+            args.quizzes,
+            args.announcements,
+            args.term,
+            past_terms=args.past_terms,
+        ),
+        latency=args.latency,
+        per_page=args.per_page,
+        throttle=args.throttle,
+        rate_limit=RateLimit(args.bucket, args.refill, args.cost),
+        cassette=Cassette(args.cassette, "replay") if args.cassette else None,
+        verbose=args.verbose,
+    )
+    print(f"Fake Canvas on http://127.0.0.1:{args.port}/ (term {args.term!r})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(
+        f"{server.requests} requests, {server.throttled} throttled, "
+        f"{server.not_modified} not modified"
+    )
+
+
+if __name__ == "__main__":
+    main()
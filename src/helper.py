@@ -1,13 +1,17 @@
 import logging
+import os
+import tempfile
 from curses import panel
 from curses import window, doupdate
-from re import sub
-from html import unescape
 
 logging.basicConfig(level=logging.INFO, filename="log")
 Logger = logging.getLogger("samplelogger")
 Logger.info("Logging Has started")
 
+# read once at import, os.umask can only be queried by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def show_panel(a_panel: panel):
     a_panel.top()
@@ -37,5 +41,17 @@ def show_panel_hide_on_keypress(a_panel, win: window):
             break
 
 
-def clean_up_html(content: str):
-    return sub("<[^<]+?>", "", unescape(content))
+def atomic_write(filename: str, data: str | bytes) -> None:
+    """Write data to a temporary file next to filename and rename it over
+    filename, so a crash or a concurrent reader never sees half a file"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as file:
+            file.write(data)
+        os.chmod(tmp, 0o666 & ~UMASK)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
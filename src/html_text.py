@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import hashlib
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+# converted texts kept in memory, by hash of their html
+CACHE_SIZE = 1024
+# tags that start a paragraph, or a line, of their own
+PARAGRAPHS = {
+    "p",
+    "blockquote",
+    "pre",
+    "table",
+    "hr",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+}
+LINES = {"div", "section", "article", "header", "footer", "tr", "dt", "dd"}
+# tags whose content isn't text
+SKIPPED = {"script", "style", "head", "title", "template"}
+
+
+class TextConverter(HTMLParser):
+    """Plain text of the html fed to it, written as it is parsed.
+
+    Whitespace is collapsed like a browser would, except in <pre>; block
+    tags become line breaks, paragraphs are separated by a blank line, list
+    items get a bullet (or their number in an <ol>) indented by their depth,
+    and links keep their target after their text unless it is the text."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self.breaks = 0  # line breaks due before the next text
+        self.space = False  # whitespace due before the next text
+        self.prefix = ""  # bullet of a list item that has no text yet
+        self.skip = 0
+        self.pre = 0
+        self.lists: list[int | None] = []  # next number of every open list
+        self.links: list[tuple[str | None, int]] = []  # href, start in parts
+
+    def line_break(self, count: int) -> None:
+        self.breaks = max(self.breaks, count)
+        self.space = False
+
+    def write(self, text: str) -> None:
+        if self.parts:
+            if self.breaks:
+                self.parts.append("\n" * self.breaks)
+            elif self.space:
+                self.parts.append(" ")
+        self.parts.append(self.prefix + text)
+        self.breaks = 0
+        self.space = False
+        self.prefix = ""
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag in SKIPPED:
+            self.skip += 1
+        elif tag == "br":
+            self.breaks = min(self.breaks + 1, 2)
+            self.space = False
+        elif tag in PARAGRAPHS:
+            self.line_break(2)
+            self.pre += tag == "pre"
+        elif tag in LINES:
+            self.line_break(1)
+        elif tag in ("ul", "ol"):
+            self.line_break(1 if self.lists else 2)
+            self.lists.append(1 if tag == "ol" else None)
+        elif tag == "li":
+            self.line_break(1)
+            number = self.lists[-1] if self.lists else None
+            if number is None:
+                bullet = "• "
+            else:
+                bullet = f"{number}. "
+                self.lists[-1] = number + 1
+            self.prefix = "  " * max(len(self.lists) - 1, 0) + bullet
+        elif tag in ("td", "th"):
+            self.space = bool(self.parts)
+        elif tag == "a":
+            self.links.append((dict(attrs).get("href"), len(self.parts)))
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIPPED:
+            self.skip = max(self.skip - 1, 0)
+        elif tag in PARAGRAPHS:
+            self.line_break(2)
+            if tag == "pre":
+                self.pre = max(self.pre - 1, 0)
+        elif tag in LINES or tag == "li":
+            self.line_break(1)
+        elif tag in ("ul", "ol") and self.lists:
+            self.lists.pop()
+            self.line_break(1 if self.lists else 2)
+        elif tag == "a" and self.links:
+            href, start = self.links.pop()
+            if not href or href.startswith(("#", "javascript:")):
+                return
+            target = href.removeprefix("mailto:")
+            text = "".join(self.parts[start:]).strip()
+            if not text:
+                self.write(target)
+            elif target != text:
+                self.space = True
+                self.write(f"({target})")
+
+    def handle_data(self, data: str) -> None:
+        if self.skip:
+            return
+        if self.pre:
+            lines = data.split("\n")
+            for index, line in enumerate(lines):
+                if index:
+                    self.breaks = min(self.breaks + 1, 2)
+                if line:
+                    self.write(line)
+            return
+        words = data.split()
+        if not words:
+            self.space = self.space or bool(data)
+            return
+        self.space = self.space or data[0].isspace()
+        self.write(" ".join(words))
+        self.space = data[-1].isspace()
+
+    def text(self) -> str:
+        # only blank lines, a leading <pre> keeps its indentation
+        return "".join(self.parts).strip("\n")
+
+
+_texts: OrderedDict[bytes, str] = OrderedDict()
+_lock = threading.Lock()
+
+
+def html_to_text(content: str | None) -> str:
+    """The text of content, converted once per distinct html"""
+    if not content:
+        return ""
+    key = hashlib.blake2b(content.encode(), digest_size=16).digest()
+    with _lock:
+        text = _texts.get(key)
+        if text is not None:
+            _texts.move_to_end(key)
+            return text
+    converter = TextConverter()
+    converter.feed(content)
+    converter.close()
+    text = converter.text()
+    with _lock:
+        _texts[key] = text
+        if len(_texts) > CACHE_SIZE:
+            _texts.popitem(last=False)
+    return text
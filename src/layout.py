@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+# laid out contents kept in memory, per width
+CACHE_SIZE = 256
+
+Content = str | list[str]
+Key = tuple[str | tuple[str, ...], int]  # content, width
+
+
+@lru_cache(maxsize=4096)
+def char_width(char: str) -> int:
+    """Terminal cells taken by char: 2 for wide and fullwidth (CJK, most
+    emoji), 0 for combining marks and format characters, 1 otherwise"""
+    if unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+def text_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return sum(char_width(char) for char in text)
+
+
+def clip(text: str, width: int) -> str:
+    """The longest start of text that fits in width cells"""
+    if text.isascii():
+        return text[: max(width, 0)]
+    used = 0
+    for index, char in enumerate(text):
+        used += char_width(char)
+        if used > width:
+            return text[:index]
+    return text
+
+
+def split_word(word: str, width: int) -> list[str]:
+    """word cut in pieces of at most width cells, for words wider than a line"""
+    pieces = []
+    while text_width(word) > width:
+        piece = clip(word, width) or word[0]  # a wide char in a 1 cell line
+        pieces.append(piece)
+        word = word[len(piece) :]
+    return pieces + [word] if word else pieces
+
+
+def wrap(line: str, width: int) -> list[str]:
+    """Word wrap a line of text (no newlines) to width cells. Leading
+    indentation is kept on the first line and hangs on the next ones"""
+    words = line.split()
+    if not words:
+        return [""]
+    indent = line[: len(line) - len(line.lstrip())]
+    if text_width(indent) >= width // 2:
+        indent = ""
+    lines: list[str] = []
+    current = ""
+    used = 0
+    for word in words:
+        size = text_width(word)
+        if current and used + 1 + size <= width:
+            current += " " + word
+            used += 1 + size
+            continue
+        if current:
+            lines.append(current)
+        current = indent + word
+        used = text_width(current)
+        if used > width:
+            *full, current = split_word(current, width)
+            lines += full
+            used = text_width(current)
+    lines.append(current)
+    return lines
+
+
+class TextLayout:
+    """Content as the display lines of a given width.
+
+    Every row of a list content, and every line of a string content, is
+    word wrapped on its own, measured in terminal cells rather than
+    characters. The lines are cached by (content, width) in an LRU, so
+    redrawing a panel that didn't change or resize doesn't lay it out
+    again."""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.cache: OrderedDict[Key, list[str]] = OrderedDict()
+
+    def lines(self, content: Content, width: int) -> list[str]:
+        if width <= 0:
+            return []
+        key = (content if isinstance(content, str) else tuple(content), width)
+        with self.lock:
+            lines = self.cache.get(key)
+            if lines is not None:
+                self.cache.move_to_end(key)
+                return lines
+        rows = [content] if isinstance(content, str) else content
+        lines = [
+            wrapped
+            for row in rows
+            for line in row.split("\n")
+            for wrapped in wrap(line, width)
+        ]
+        with self.lock:
+            self.cache[key] = lines
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return lines
+
+
+layout = TextLayout()
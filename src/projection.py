@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import lzma
+import os
+import threading
+import zlib
+from typing import Any, Callable
+
+from helper import atomic_write
+
+# Fields of every resource that the UI reads. A nested schema projects the
+# dict (or list of dicts) stored under that field, None keeps it as is.
+Schema = dict[str, Any]
+
+SCHEMAS: dict[str, Schema] = {
+    "courses": {
+        "id": None,
+        "name": None,
+        "course_code": None,
+        "syllabus_body": None,
+        "term": {"name": None, "start_at": None},
+        "teachers": {"display_name": None},
+        "enrollments": {"type": None, "computed_current_score": None},
+    },
+    "assignments": {
+        "id": None,
+        "name": None,
+        "html_url": None,
+        "points_possible": None,
+        "created_at": None,
+        "updated_at": None,
+        "due_at": None,
+        "submission": {"submitted_at": None, "score": None},
+    },
+    "announcements": {
+        "id": None,
+        "title": None,
+        "message": None,
+        "user_name": None,
+        "created_at": None,
+        "updated_at": None,
+        "context_code": None,
+    },
+    "quizzes": {
+        "id": None,
+        "title": None,
+        "html_url": None,
+        "due_at": None,
+        "updated_at": None,
+    },
+    "files": {
+        "id": None,
+        "display_name": None,
+        "mime_class": None,
+        "size": None,
+        "url": None,
+        "created_at": None,
+        "updated_at": None,
+    },
+}
+
+
+def project(obj: Any, schema: Schema) -> Any:
+    if isinstance(obj, list):
+        return [project(item, schema) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    return {
+        field: obj[field] if sub_schema is None else project(obj[field], sub_schema)
+        for field, sub_schema in schema.items()
+        if field in obj
+    }
+
+
+def project_items(resource: str, items: list[dict[str, Any]] | None) -> Any:
+    """Slim items down to the fields of resource the UI displays"""
+    if not isinstance(items, list) or resource not in SCHEMAS:
+        return items
+    return [project(item, SCHEMAS[resource]) for item in items]
+
+
+def overlay(full: Any, projected: Any) -> Any:
+    """Lay a (possibly projected) object over the full one it came from"""
+    if not isinstance(full, dict) or not isinstance(projected, dict):
+        return projected
+    return {
+        **full,
+        **{
+            field: overlay(full.get(field), value) for field, value in projected.items()
+        },
+    }
+
+
+Codec = tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+# extension, compress and decompress of every cold_compression setting
+CODECS: dict[str, Codec] = {
+    "gzip": (".gz", gzip.compress, gzip.decompress),
+    "zlib": (".zz", zlib.compress, zlib.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+    "none": ("", lambda data: data, lambda data: data),
+}
+
+
+class ColdStore:
+    """Full Canvas objects, compressed under <cache_dir>/cold, for when the
+    projected hot cache isn't enough. Entries written with another codec
+    are still read, and replaced by the next write"""
+
+    def __init__(self, cache_dir: str, codec: str = "gzip"):
+        self.dir = os.path.join(cache_dir, "cold")
+        self.lock = threading.Lock()
+        self.codec = codec if codec in CODECS else "gzip"
+        os.makedirs(self.dir, exist_ok=True)
+
+    def path(self, name: str, codec: str | None = None) -> str:
+        return os.path.join(self.dir, f"{name}.json{CODECS[codec or self.codec][0]}")
+
+    def read(self, name: str) -> Any:
+        codecs = [self.codec] + [codec for codec in CODECS if codec != self.codec]
+        for codec in codecs:
+            try:
+                with open(self.path(name, codec), "rb") as file:
+                    return json.loads(CODECS[codec][2](file.read()))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, EOFError, lzma.LZMAError, zlib.error):
+                return None
+        return None
+
+    def write(self, name: str, items: list[dict[str, Any]] | None) -> None:
+        """Store items, keeping the full fields of cached objects that came
+        back projected (pages reused from the hot cache after a 304)"""
+        if not isinstance(items, list):
+            return
+        with self.lock:
+            cached = self.read(name)
+            cached = {
+                item["id"]: item for item in cached or [] if isinstance(item, dict)
+            }
+            items = [
+                (
+                    overlay(cached.get(item.get("id")), item)
+                    if isinstance(item, dict)
+                    else item
+                )
+                for item in items
+            ]
+            atomic_write(
+                self.path(name), CODECS[self.codec][1](json.dumps(items).encode())
+            )
+            for codec in CODECS:
+                if codec != self.codec and os.path.exists(self.path(name, codec)):
+                    os.remove(self.path(name, codec))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+import time
+from typing import Callable
+
+from helper import Logger
+from store import RESOURCES, CacheStore
+from sync import SyncReport
+
+# seconds the cache of a resource is considered fresh for
+TTLS = {
+    "announcements": 10 * 60,
+    "assignments": 30 * 60,
+    "quizzes": 60 * 60,
+    "files": 2 * 60 * 60,
+}
+
+FRESH = "fresh"
+STALE = "stale"
+SYNCING = "syncing"
+
+
+class Refresher:
+    """Revalidate the cache on a background thread while the UI shows it.
+
+    Every interval, the resources whose cache is older than their ttl for
+    any of course_ids are synced as a delta through sync(resources, delta),
+    which fetches them for every course. The UI thread never waits on it:
+    it calls poll() when idle and gets back the ids of the courses whose
+    cache was replaced since the last call."""
+
+    def __init__(
+        self,
+        store: CacheStore,
+        course_ids: list[int],
+        sync: Callable[[set[str], bool], SyncReport],
+        ttls: dict[str, float] | None = None,
+        interval: float = 60,
+    ):
+        self.store = store
+        self.course_ids = course_ids
+        self.sync = sync
+        self.ttls = {**TTLS, **(ttls or {})}
+        self.interval = interval
+        self.states: dict[int, str] = {}
+        self.updates: queue.SimpleQueue[set[int]] = queue.SimpleQueue()
+        self.wake = threading.Event()
+        self.forced: tuple[set[str], bool] | None = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> "Refresher":
+        self.check()
+        self.thread.start()
+        return self
+
+    def trigger(self, resources: set[str] | None = None, delta: bool = False) -> None:
+        """Sync resources (all of them by default) now, whatever their age"""
+        self.forced = (set(resources or RESOURCES), delta)
+        self.wake.set()
+
+    def stale(self) -> dict[int, set[str]]:
+        """Resources of each course whose cache outlived its ttl"""
+        synced_at = self.store.synced_at()
+        now = time.time()
+        stale: dict[int, set[str]] = {}
+        for course_id in self.course_ids:
+            for resource in RESOURCES:
+                age = now - synced_at.get((resource, course_id), 0)
+                if age > self.ttls[resource]:
+                    stale.setdefault(course_id, set()).add(resource)
+        return stale
+
+    def check(self) -> dict[int, set[str]]:
+        stale = self.stale()
+        self.set_states({id: STALE if id in stale else FRESH for id in self.course_ids})
+        return stale
+
+    def set_states(self, states: dict[int, str]) -> None:
+        changed = {id for id, state in states.items() if self.states.get(id) != state}
+        self.states.update(states)
+        if changed:
+            self.updates.put(set())  # only the freshness markers changed
+
+    def state(self, course_id: int) -> str:
+        return self.states.get(course_id, FRESH)
+
+    def run(self) -> None:
+        while True:
+            forced, self.forced = self.forced, None
+            if forced:
+                resources, delta = forced
+            elif self.interval:
+                resources, delta = set().union(*self.check().values()), True
+            else:
+                resources = set()
+            if resources:
+                self.set_states({id: SYNCING for id in self.course_ids})
+                try:
+                    report = self.sync(resources, delta)
+                    self.updates.put(set(report.timings))
+                except Exception as e:
+                    Logger.info(f"Background refresh of {resources} failed: {e!r}")
+                self.check()
+            self.wake.wait(self.interval or None)
+            self.wake.clear()
+
+    def poll(self) -> set[int] | None:
+        """Ids of the courses refreshed since the last poll, None if nothing
+        changed, an empty set if only their freshness did"""
+        updated = None
+        while True:
+            try:
+                course_ids = self.updates.get_nowait()
+            except queue.Empty:
+                return updated
+            updated = (updated or set()) | course_ids
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import time
+from http.client import HTTPException
+from typing import Any, Callable
+
+from helper import Logger
+from transport import RequestError, Response
+
+# raised by a request that may work when retried: resets, timeouts, dns
+# failures (all OSError) and truncated or garbled responses
+TRANSIENT_ERRORS = (OSError, HTTPException)
+
+
+class RateLimitScheduler:
+    """Adapt the number of in-flight requests to the Canvas rate limit.
+
+    Canvas hands every token a bucket (X-Rate-Limit-Remaining) that each
+    request drains by its X-Request-Cost. The in-flight limit grows by one
+    request per round of successful requests and is halved when the bucket
+    runs low or a request gets throttled (AIMD), at most once per round trip
+    since the responses of a round were all sent under the limit being cut."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        low_water: float = 100.0,
+    ):
+        self.cond = threading.Condition()
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_water = low_water
+        self.remaining: float | None = None
+        self.cost: float | None = None
+        self.throttled = 0
+        self.retries = 0
+        self.rtt = 0.0  # smoothed seconds a request takes
+        self.decreased_at = float("-inf")
+        # called when a slot may have freed up, by waiters that can't block
+        # on cond like the event loop of the async backend
+        self.listeners: list[Callable[[], None]] = []
+
+    def set_max_concurrency(self, max_concurrency: int) -> None:
+        with self.cond:
+            self.max_concurrency = max(1, max_concurrency)
+            self.limit = min(self.limit, self.max_concurrency)
+            self.notify()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        with self.cond:
+            self.listeners.append(listener)
+
+    def notify(self) -> None:
+        self.cond.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def acquire(self) -> None:
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free under the limit, without waiting"""
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self.cond:
+            self.in_flight -= 1
+            self.notify()
+
+    def note_retry(self) -> None:
+        with self.cond:
+            self.retries += 1
+
+    def note_throttled(self) -> None:
+        with self.cond:
+            self.throttled += 1
+
+    def note_rtt(self, seconds: float) -> None:
+        with self.cond:
+            self.rtt = seconds if not self.rtt else 0.875 * self.rtt + 0.125 * seconds
+
+    def decrease(self) -> None:
+        """Halve the limit, unless it was already halved this round trip"""
+        with self.cond:
+            now = time.monotonic()
+            if now - self.decreased_at < self.rtt:
+                return
+            self.decreased_at = now
+            self.limit = max(1.0, self.limit / 2)
+
+    def observe(self, response: Response) -> None:
+        """Read the rate limit headers of response and adjust the limit"""
+        remaining = response.getheader("x-rate-limit-remaining")
+        cost = response.getheader("x-request-cost")
+        with self.cond:
+            if cost is not None:
+                self.cost = float(cost)
+            if remaining is None:
+                return
+            self.remaining = float(remaining)
+            if self.remaining < self.low_water:
+                self.decrease()
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.notify()
+
+    @staticmethod
+    def is_throttled(response: Response) -> bool:
+        if response.status == 429:
+            return True
+        return response.status == 403 and (
+            response.getheader("x-rate-limit-remaining") in ("0", "0.0")
+            or b"Rate Limit Exceeded" in response.read()
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def check(self, response: Response) -> str | None:
+        """Observe response, returns why it has to be retried or None if it
+        can be used"""
+        self.observe(response)
+        if self.is_throttled(response):
+            self.note_throttled()
+            if response.getheader("x-rate-limit-remaining") is None:
+                self.decrease()  # otherwise observe already backed off
+            return f"throttled ({response.status})"
+        if response.status >= 500:
+            return f"server error ({response.status})"
+        return None
+
+    def give_up(self, error: Any) -> RequestError:
+        return RequestError(f"Giving up after {self.max_retries + 1} attempts: {error}")
+
+    def request(self, send: Callable[[], Response]) -> Response:
+        """Run send once a slot is free, retrying throttled and 5xx responses"""
+        error: Any = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.note_retry()
+                time.sleep(self.backoff(attempt))
+            self.acquire()
+            started = time.monotonic()
+            try:
+                response = send()
+            except TRANSIENT_ERRORS as e:
+                error = e
+                Logger.info(f"Retrying after {e!r}")
+                continue
+            finally:
+                self.release()
+            self.note_rtt(time.monotonic() - started)
+            error = self.check(response)
+            if error is None:
+                response.retries = attempt
+                return response
+            Logger.info(f"Retrying {response.url}: {error}")
+        raise self.give_up(error)
+
+    def budget(self) -> dict[str, Any]:
+        """Current view of the rate limit budget"""
+        with self.cond:
+            return {
+                "remaining": self.remaining,
+                "cost": self.cost,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "retries": self.retries,
+            }
+
+
+scheduler = RateLimitScheduler()
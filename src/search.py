@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import heapq
+import marshal
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Any
+
+from helper import Logger, atomic_write
+from html_text import html_to_text
+from store import CacheStore, columns_of
+
+INDEX_VERSION = 1
+TOKEN = re.compile(r"\w+")
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# title column and indexed columns of every searchable resource. Assignment
+# descriptions aren't cached, they are indexed from the payloads syncs fetch
+FIELDS = {
+    "courses": ("name", ["name", "syllabus_body"]),
+    "announcements": ("title", ["title", "message"]),
+    "assignments": ("name", ["name", "description"]),
+    "files": ("display_name", ["display_name"]),
+}
+
+Key = tuple[str, int, Any]  # resource, course id, item id
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted index over the text of the cached items, ranked with BM25.
+
+    Every item of a searchable resource is a document keyed by (resource,
+    course id, item id); syllabi are documents of the "courses" resource.
+    Documents remember a checksum of their text, so re-indexing what a sync
+    wrote only tokenizes the items that changed. Persisted with marshal to
+    <cache_dir>/search.idx, and only read, or built from store if there is
+    none yet, on first use."""
+
+    def __init__(self, cache_dir: str, store: CacheStore):
+        self.filename = os.path.join(cache_dir, "search.idx")
+        self.store = store
+        self.lock = threading.Lock()
+        self.loading = threading.RLock()
+        self.loaded = False
+        # key -> (title, length, checksum, terms)
+        self.docs: dict[Key, tuple[str, int, int, tuple[str, ...]]] = {}
+        self.postings: dict[str, dict[Key, int]] = {}
+        self.sources: dict[tuple[str, int], set[Key]] = defaultdict(set)
+        self.total_length = 0
+        self.dirty = False
+
+    def load(self) -> None:
+        with self.loading:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not self.read():  # caches of versions without the index
+                self.refresh()
+                self.save()
+
+    def read(self) -> bool:
+        try:
+            with open(self.filename, "rb") as file:
+                data = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return False
+        self.docs, self.postings = data["docs"], data["postings"]
+        for key, doc in self.docs.items():
+            self.sources[key[:2]].add(key)
+            self.total_length += doc[1]
+        return True
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            data = marshal.dumps(
+                {"version": INDEX_VERSION, "docs": self.docs, "postings": self.postings}
+            )
+            self.dirty = False
+        atomic_write(self.filename, data)
+
+    def add(self, key: Key, title: str, text: str, checksum: int) -> None:
+        tokens = tokenize(text)
+        counts: dict[str, int] = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for token, count in counts.items():
+            self.postings.setdefault(token, {})[key] = count
+        self.docs[key] = (title, len(tokens), checksum, tuple(counts))
+        self.sources[key[:2]].add(key)
+        self.total_length += len(tokens)
+
+    def remove(self, key: Key) -> None:
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for token in doc[3]:
+            postings = self.postings[token]
+            del postings[key]
+            if not postings:
+                del self.postings[token]
+        self.sources[key[:2]].discard(key)
+        self.total_length -= doc[1]
+
+    def update(
+        self,
+        resource: str,
+        course_id: int,
+        items: list[dict[str, Any]] | None,
+        unchanged: set[Any] | None = None,
+    ) -> int:
+        """Index the items of resource cached for a course, dropping the ones
+        that are gone. Indexed items with an id in unchanged are kept as they
+        are, e.g. the projected items of pages answered with a 304. Returns
+        the number of documents (re)tokenized"""
+        self.load()
+        title_column, columns = FIELDS[resource]
+        course_id = int(course_id)
+        changed = 0
+        with self.lock:
+            seen = set()
+            for item in items or []:
+                key = (resource, course_id, item["id"])
+                seen.add(key)
+                if unchanged and item["id"] in unchanged and key in self.docs:
+                    continue
+                text = "\n".join(
+                    html_to_text(item[column]) for column in columns if item.get(column)
+                )
+                checksum = zlib.crc32(text.encode())
+                if key in self.docs and self.docs[key][2] == checksum:
+                    continue
+                self.remove(key)
+                self.add(key, item.get(title_column) or "", text, checksum)
+                changed += 1
+            for key in self.sources[(resource, course_id)] - seen:
+                self.remove(key)
+                changed += 1
+            self.dirty = self.dirty or changed > 0
+        return changed
+
+    def refresh(self, sources: set[tuple[str, int]] | None = None) -> None:
+        """Re-index every course and the resources of sources from the store,
+        all those synced into it by default"""
+        self.load()
+        start = time.time()
+        store = self.store
+        if sources is None:
+            sources = set(store.synced_at())
+        changed = 0
+        for course in store.courses(["id", *FIELDS["courses"][1]]):
+            changed += self.update("courses", course["id"], [course])
+        for resource, course_id in sources:
+            if resource in FIELDS:
+                columns = ["id", *FIELDS[resource][1]]
+                columns = [
+                    column for column in columns if column in columns_of(resource)
+                ]
+                changed += self.update(
+                    resource, course_id, store.items(resource, course_id, columns)
+                )
+        Logger.info(
+            f"Indexed {changed} changed documents in {time.time() - start:.2f}s, "
+            f"{len(self.docs)} in total"
+        )
+
+    def search(
+        self, query: str, course_ids: list[int] | None = None, limit: int = 50
+    ) -> list[dict[str, Any]]:
+        """The best matches of query, restricted to course_ids if given"""
+        self.load()
+        allowed = None if course_ids is None else {int(id) for id in course_ids}
+        with self.lock:
+            if not self.docs:
+                return []
+            count = len(self.docs)
+            average = self.total_length / count or 1
+            scores: dict[Key, float] = defaultdict(float)
+            for token in set(tokenize(query)):
+                postings = self.postings.get(token, {})
+                matches = len(postings)
+                idf = math.log(1 + (count - matches + 0.5) / (matches + 0.5))
+                for key, frequency in postings.items():
+                    if allowed is not None and key[1] not in allowed:
+                        continue
+                    length = self.docs[key][1]
+                    scores[key] += idf * (
+                        frequency
+                        * (K1 + 1)
+                        / (frequency + K1 * (1 - B + B * length / average))
+                    )
+            best = heapq.nlargest(limit, scores.items(), key=lambda hit: hit[1])
+            return [
+                {
+                    "resource": resource,
+                    "course_id": course_id,
+                    "id": item_id,
+                    "title": self.docs[(resource, course_id, item_id)][0],
+                    "score": score,
+                }
+                for (resource, course_id, item_id), score in best
+            ]
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+from helper import atomic_write
+
+# syncs kept in the trace file, older ones are dropped as new ones come in
+TRACE_SYNCS = 20
+COURSE_PATH = re.compile(r"/courses/(\d+)")
+NUMBERS = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(url: str) -> tuple[str, str | None]:
+    """Endpoint template and course id of a request url, e.g.
+    /api/v1/courses/123/files -> ("courses/:id/files", "123")"""
+    parts = urlsplit(url)
+    endpoint = NUMBERS.sub("/:id", parts.path).removeprefix("/api/v1/").strip("/")
+    match = COURSE_PATH.search(parts.path)
+    course_id = match.group(1) if match else None
+    if course_id is None:
+        for key, value in parse_qsl(parts.query):
+            if key == "context_codes[]" and value.startswith("course_"):
+                course_id = value[7:]
+                break
+    return endpoint, course_id
+
+
+class RequestRecord:
+    """Everything a paginated call to one endpoint cost"""
+
+    def __init__(
+        self,
+        url: str,
+        latency: float,
+        pages: int = 0,
+        bytes: int = 0,
+        retries: int = 0,
+        not_modified: int = 0,
+        cost: float = 0.0,
+        ok: bool = True,
+    ):
+        self.endpoint, self.course_id = endpoint_of(url)
+        self.url = url
+        self.time = time.time()
+        self.latency = latency
+        self.pages = pages
+        self.bytes = bytes
+        self.retries = retries
+        self.not_modified = not_modified
+        self.cost = cost
+        self.ok = ok
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(vars(self))
+
+
+class RequestStats:
+    """Ring buffer of the most recent request records"""
+
+    def __init__(self, size: int = 2048):
+        self.lock = threading.Lock()
+        self.records: deque[RequestRecord] = deque(maxlen=size)
+        self.added = 0
+        self.dumped = 0
+
+    def add(self, record: RequestRecord) -> None:
+        with self.lock:
+            self.records.append(record)
+            self.added += 1
+
+    def snapshot(self) -> list[RequestRecord]:
+        with self.lock:
+            return list(self.records)
+
+    def summary(self, key: str = "endpoint") -> list[dict[str, Any]]:
+        """Totals grouped by endpoint or course_id, slowest first"""
+        groups: dict[Any, dict[str, Any]] = {}
+        for record in self.snapshot():
+            name = getattr(record, key)
+            group = groups.setdefault(
+                name,
+                {
+                    key: name,
+                    "calls": 0,
+                    "latency": 0.0,
+                    "max_latency": 0.0,
+                    "pages": 0,
+                    "bytes": 0,
+                    "retries": 0,
+                    "not_modified": 0,
+                    "cost": 0.0,
+                    "errors": 0,
+                },
+            )
+            group["calls"] += 1
+            group["latency"] += record.latency
+            group["max_latency"] = max(group["max_latency"], record.latency)
+            group["pages"] += record.pages
+            group["bytes"] += record.bytes
+            group["retries"] += record.retries
+            group["not_modified"] += record.not_modified
+            group["cost"] += record.cost
+            group["errors"] += not record.ok
+        return sorted(groups.values(), key=lambda group: group["latency"], reverse=True)
+
+    def table(
+        self, key: str = "endpoint", names: dict[str, str] | None = None
+    ) -> list[str]:
+        """summary(key) as fixed width text rows, headed by the column names"""
+        names = names or {}
+        lines = [
+            f"{key:<30} {'calls':>5} {'time':>7} {'max':>6} {'pages':>5} "
+            f"{'KiB':>7} {'304':>4} {'retry':>5} {'cost':>6} {'err':>3}"
+        ]
+        for group in self.summary(key):
+            name = names.get(group[key], str(group[key]))
+            lines.append(
+                f"{name[:30]:<30} {group['calls']:>5} {group['latency']:>6.2f}s "
+                f"{group['max_latency']:>5.2f}s {group['pages']:>5} "
+                f"{group['bytes'] / 1024:>7.1f} {group['not_modified']:>4} "
+                f"{group['retries']:>5} {group['cost']:>6.1f} {group['errors']:>3}"
+            )
+        return lines
+
+    def dump(self, filename: str, keep: int = TRACE_SYNCS) -> None:
+        """Add the records added since the last dump to a json lines trace,
+        stamped as one sync, keeping only the last keep syncs in it"""
+        with self.lock:
+            count = min(self.added - self.dumped, len(self.records))
+            new = list(self.records)[len(self.records) - count :]
+            self.dumped = self.added
+        sync = time.time()
+        lines = [json.dumps({**record.to_dict(), "sync": sync}) for record in new]
+        try:
+            with open(filename) as file:
+                kept = [json.loads(line) for line in file]
+        except (OSError, ValueError):
+            kept = []
+        syncs = sorted({record.get("sync", 0) for record in kept})
+        syncs = syncs[max(len(syncs) - keep + 1, 0) :] if keep > 1 else []
+        lines = [
+            json.dumps(record) for record in kept if record.get("sync", 0) in syncs
+        ] + lines
+        atomic_write(filename, "".join(line + "\n" for line in lines))
+
+
+stats = RequestStats()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from helper import Logger
+from projection import SCHEMAS, project_items
+
+SCHEMA_VERSION = 1
+RESOURCES = ["assignments", "announcements", "quizzes", "files"]
+# columns, besides course_id, that the UI filters or sorts on
+INDEXES = {
+    "courses": ["term_name"],
+    "assignments": ["due_at", "updated_at"],
+    "announcements": ["context_code", "created_at", "updated_at"],
+    "quizzes": ["due_at", "updated_at"],
+    "files": ["updated_at"],
+}
+JSON_CACHE_FILE = re.compile(r"^(%s)(\d+)\.json$" % "|".join(RESOURCES))
+
+
+def columns_of(resource: str) -> list[str]:
+    columns = list(SCHEMAS[resource])
+    if resource == "courses":
+        columns.append("term_name")
+    return columns
+
+
+def nested(resource: str) -> set[str]:
+    """Fields stored as json text, the ones with a nested schema"""
+    return {field for field, schema in SCHEMAS[resource].items() if schema is not None}
+
+
+class CacheStore:
+    """The projected cache in one sqlite database (WAL mode) under cache_dir.
+
+    Every resource gets a table with a column per projected field; nested
+    fields (submission, term, teachers...) are kept as json text. Rows
+    remember the position Canvas returned them in, so reads come back in
+    the order the json cache files used to have. Every sync of a resource
+    for a course is stamped in `synced`, marked unavailable when Canvas
+    doesn't expose it, to tell an empty tab apart from a missing one. The
+    page validators of a resource are written in the same transaction as
+    its items, as ranges of their positions."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(cache_dir, "cache.db"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self.migrate()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def migrate(self) -> None:
+        """Create the tables, importing the json cache files they replace"""
+        start = time.time()
+        with self.transaction():
+            self.create_tables()
+            self.import_json_cache()
+            self.db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.remove_json_cache()
+        Logger.info(
+            f"Migrated cache to version {SCHEMA_VERSION} in {time.time() - start:.2f}s"
+        )
+
+    def create_tables(self) -> None:
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS courses (id INTEGER PRIMARY KEY, "
+            f"position INTEGER, {', '.join(columns_of('courses')[1:])})"
+        )
+        for resource in RESOURCES:
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {resource} (course_id INTEGER, "
+                f"position INTEGER, {', '.join(columns_of(resource))}, "
+                "PRIMARY KEY (course_id, position))"
+            )
+        for resource, columns in INDEXES.items():
+            prefix = "" if resource == "courses" else "course_id, "
+            for column in columns:
+                self.db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {resource}_{column} "
+                    f"ON {resource} ({prefix}{column})"
+                )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS synced "
+            "(resource TEXT, course_id INTEGER, synced_at REAL, "
+            "available INTEGER DEFAULT 1, PRIMARY KEY (resource, course_id))"
+        )
+        # course_id is 0 for the courses themselves
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS validators "
+            "(resource TEXT, course_id INTEGER, pages TEXT, "
+            "PRIMARY KEY (resource, course_id))"
+        )
+
+    def import_json_cache(self) -> None:
+        def read(filename: str) -> Any:
+            try:
+                with open(os.path.join(self.cache_dir, filename)) as file:
+                    return json.loads(file.read())
+            except (OSError, ValueError):
+                return None
+
+        courses = read("courses.json")
+        if isinstance(courses, list):
+            self.write_courses(courses)
+        for filename in os.listdir(self.cache_dir):
+            match = JSON_CACHE_FILE.match(filename)
+            if match:
+                resource, course_id = match.group(1), int(match.group(2))
+                self.write_items(resource, course_id, read(filename))
+
+    def remove_json_cache(self) -> None:
+        """Delete the json cache files that the store replaces"""
+        for filename in os.listdir(self.cache_dir):
+            if filename == "courses.json" or JSON_CACHE_FILE.match(filename):
+                os.remove(os.path.join(self.cache_dir, filename))
+
+    def to_row(self, resource: str, item: dict[str, Any]) -> list[Any]:
+        json_fields = nested(resource)
+        row = []
+        for column in columns_of(resource):
+            if column == "term_name":
+                value = (item.get("term") or {}).get("name")
+            else:
+                value = item.get(column)
+            if column in json_fields and value is not None:
+                value = json.dumps(value)
+            row.append(value)
+        return row
+
+    def write_courses(self, courses: list[dict[str, Any]]) -> None:
+        """Replace the courses of the terms in courses, keeping the ones of
+        other terms Canvas may no longer list after them"""
+        columns = columns_of("courses")
+        terms = {(course.get("term") or {}).get("name") for course in courses}
+        self.db.execute("DELETE FROM courses WHERE term_name IS NULL")
+        self.db.executemany(
+            "DELETE FROM courses WHERE term_name = ?",
+            [(term,) for term in terms if term is not None],
+        )
+        self.db.execute("UPDATE courses SET position = position + ?", (len(courses),))
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO courses (position, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 1))})",
+            [
+                [position, *self.to_row("courses", course)]
+                for position, course in enumerate(project_items("courses", courses))
+            ],
+        )
+
+    def write_items(self, resource: str, course_id: int, items: Any) -> None:
+        self.db.execute(f"DELETE FROM {resource} WHERE course_id = ?", (course_id,))
+        self.db.execute(
+            "INSERT OR REPLACE INTO synced VALUES (?, ?, ?, ?)",
+            (resource, course_id, time.time(), isinstance(items, list)),
+        )
+        if not isinstance(items, list):
+            return
+        columns = columns_of(resource)
+        self.db.executemany(
+            f"INSERT INTO {resource} (course_id, position, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+            [
+                [course_id, position, *self.to_row(resource, item)]
+                for position, item in enumerate(project_items(resource, items))
+            ],
+        )
+
+    def write_validators(
+        self, resource: str, course_id: int, pages: list[dict[str, Any]] | None
+    ) -> None:
+        self.db.execute(
+            "DELETE FROM validators WHERE resource = ? AND course_id = ?",
+            (resource, course_id),
+        )
+        if pages:
+            self.db.execute(
+                "INSERT INTO validators VALUES (?, ?, ?)",
+                (resource, course_id, json.dumps(pages)),
+            )
+
+    def replace_courses(
+        self,
+        courses: list[dict[str, Any]],
+        validators: list[dict[str, Any]] | None = None,
+    ) -> None:
+        with self.transaction():
+            self.write_courses(courses)
+            self.write_validators("courses", 0, validators)
+
+    def replace(
+        self,
+        resource: str,
+        course_id: int,
+        items: Any,
+        validators: list[dict[str, Any]] | None = None,
+    ) -> None:
+        """Swap the cached items of resource for a course, and the validators
+        of the pages they came from, in one transaction. Items that aren't a
+        list mark the resource unavailable for the course"""
+        with self.transaction():
+            self.write_items(resource, int(course_id), items)
+            self.write_validators(resource, int(course_id), validators)
+
+    def forget(self, course_id: int) -> None:
+        """Drop every cached resource of a course, as if it was never synced"""
+        with self.transaction():
+            for resource in RESOURCES:
+                self.db.execute(
+                    f"DELETE FROM {resource} WHERE course_id = ?", (int(course_id),)
+                )
+            self.db.execute("DELETE FROM synced WHERE course_id = ?", (int(course_id),))
+            self.db.execute(
+                "DELETE FROM validators WHERE course_id = ?", (int(course_id),)
+            )
+
+    def vacuum(self) -> None:
+        """Give the pages of deleted rows back to the file system"""
+        with self.lock:
+            self.db.execute("VACUUM")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def select(
+        self, resource: str, columns: list[str] | None, sql: str, params: tuple
+    ) -> list[dict[str, Any]]:
+        """Rows of resource as dicts of the given columns (all by default)"""
+        columns = columns or columns_of(resource)
+        unknown = set(columns) - set(columns_of(resource))
+        if unknown:
+            raise ValueError(f"{resource} has no column {', '.join(unknown)}")
+        json_fields = nested(resource)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {', '.join(columns)} FROM {resource} {sql}", params
+            ).fetchall()
+        # a nested field that is NULL was missing from the Canvas object
+        return [
+            {
+                column: json.loads(value) if column in json_fields else value
+                for column, value in zip(columns, row)
+                if value is not None or column not in json_fields
+            }
+            for row in rows
+        ]
+
+    def courses(self, columns: list[str] | None = None) -> list[dict[str, Any]]:
+        return self.select("courses", columns, "ORDER BY position", ())
+
+    def has(self, resource: str, course_id: int) -> bool:
+        with self.lock:
+            return (
+                self.db.execute(
+                    "SELECT 1 FROM synced "
+                    "WHERE resource = ? AND course_id = ? AND available",
+                    (resource, int(course_id)),
+                ).fetchone()
+                is not None
+            )
+
+    def synced(self, course_id: int) -> set[str]:
+        """Resources synced for a course"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT resource FROM synced WHERE course_id = ? AND available",
+                (int(course_id),),
+            ).fetchall()
+        return {resource for resource, in rows}
+
+    def synced_at(self) -> dict[tuple[str, int], float]:
+        """When each (resource, course id) was last synced, available or not"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT resource, course_id, synced_at FROM synced"
+            ).fetchall()
+        return {(resource, course_id): at for resource, course_id, at in rows}
+
+    def items(
+        self, resource: str, course_id: int, columns: list[str] | None = None
+    ) -> list[dict[str, Any]] | None:
+        """columns of every cached item of resource for a course, in Canvas
+        order, None if the resource was never synced for it"""
+        if not self.has(resource, course_id):
+            return None
+        return self.select(
+            resource,
+            columns,
+            "WHERE course_id = ? ORDER BY position",
+            (int(course_id),),
+        )
+
+    def validators(self, resource: str, course_id: int = 0) -> list[dict[str, Any]]:
+        """Validators of the pages the cached items of resource came from,
+        each with the items at the positions the page produced"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT pages FROM validators WHERE resource = ? AND course_id = ?",
+                (resource, int(course_id)),
+            ).fetchone()
+        if row is None:
+            return []
+        pages = json.loads(row[0])
+        if resource == "courses":
+            items = self.courses()
+        else:
+            items = self.items(resource, course_id) or []
+        if len(items) < pages[-1]["end"]:
+            return []
+        for page in pages:
+            page["items"] = items[page["start"] : page["end"]]
+        return pages
+
+    def sizes(self) -> dict[int, tuple[int, float]]:
+        """Rough bytes taken by the cached items of every synced course, and
+        when it was last synced"""
+        sizes: dict[int, int] = defaultdict(int)
+        with self.lock:
+            for resource in RESOURCES:
+                length = " + ".join(
+                    f"IFNULL(LENGTH({column}), 0)" for column in columns_of(resource)
+                )
+                rows = self.db.execute(
+                    f"SELECT course_id, SUM({length}) FROM {resource} GROUP BY course_id"
+                )
+                for course_id, size in rows:
+                    sizes[course_id] += size
+            synced = self.db.execute(
+                "SELECT course_id, MAX(synced_at) FROM synced GROUP BY course_id"
+            ).fetchall()
+        return {course_id: (sizes[course_id], at) for course_id, at in synced}
+
+    def first(
+        self, resource: str, course_id: int, columns: list[str] | None = None
+    ) -> dict[str, Any] | None:
+        """The first cached item of resource for a course, e.g. the latest
+        announcement as Canvas lists them newest first"""
+        rows = self.select(
+            resource,
+            columns,
+            "WHERE course_id = ? ORDER BY position LIMIT 1",
+            (int(course_id),),
+        )
+        return rows[0] if rows else None
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable
+
+from helper import Logger, atomic_write
+
+
+def high_water_mark(items: list[dict[str, Any]] | None) -> str | None:
+    """Newest updated_at/created_at timestamp among items"""
+    marks = [
+        item.get("updated_at") or item.get("created_at")
+        for item in items or []
+        if isinstance(item, dict)
+    ]
+    marks = [mark for mark in marks if mark]
+    return max(marks) if marks else None
+
+
+def merge_items(
+    cached: list[dict[str, Any]] | None, items: list[dict[str, Any]]
+) -> list[dict[str, Any]]:
+    """Update cached items in place by id and put the new ones first, in the
+    newest first order the delta fetches list them in like the full ones"""
+    merged = list(cached) if isinstance(cached, list) else []
+    index = {item["id"]: i for i, item in enumerate(merged)}
+    added: dict[Any, Any] = {}
+    for item in items:
+        if item["id"] in index:
+            merged[index[item["id"]]] = item
+        else:
+            added[item["id"]] = item
+    return list(added.values()) + merged
+
+
+class SyncState:
+    """High-water marks of every (resource, course) pair, kept in sync_state.json"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        try:
+            with open(filename) as file:
+                self.marks: dict[str, str] = json.loads(file.read())
+        except (OSError, ValueError):
+            self.marks = {}
+
+    def get(self, resource: str, course_id: str) -> str | None:
+        with self.lock:
+            return self.marks.get(f"{resource}{course_id}")
+
+    def update(self, resource: str, course_id: str, items: list | None) -> None:
+        mark = high_water_mark(items)
+        if mark is None:
+            return
+        with self.lock:
+            key = f"{resource}{course_id}"
+            self.marks[key] = max(mark, self.marks.get(key, mark))
+
+    def save(self) -> None:
+        with self.lock:
+            atomic_write(self.filename, json.dumps(self.marks))
+
+
+class SyncJob:
+    """A single (course, resource) request and the callback that caches it.
+    A batched request, e.g. a graphql query, has the list of its courses"""
+
+    def __init__(
+        self,
+        course_id: str | list[str],
+        resource: str,
+        fetch: Callable[[], Any],
+        on_done: Callable[[Any], None],
+    ):
+        self.course_id = course_id
+        self.resource = resource
+        self.fetch = fetch
+        self.on_done = on_done
+
+    @property
+    def course_ids(self) -> list[str]:
+        return self.course_id if isinstance(self.course_id, list) else [self.course_id]
+
+
+class SyncReport:
+    """Per course and per resource timings of a finished sync"""
+
+    def __init__(self):
+        self.elapsed: float = 0.0
+        self.timings: dict[str, dict[str, float]] = defaultdict(dict)
+        self.finished_at: dict[str, float] = {}
+        self.failed: list[tuple[str, str]] = []
+
+    def record(self, job: SyncJob, seconds: float, offset: float):
+        for course_id in job.course_ids:
+            self.timings[course_id][job.resource] = seconds
+            self.finished_at[course_id] = max(
+                self.finished_at.get(course_id, 0), offset
+            )
+
+    def fail(self, job: SyncJob) -> None:
+        self.failed += [(course_id, job.resource) for course_id in job.course_ids]
+
+    def course_time(self, course_id: str) -> float:
+        """Wall clock time from the start of the sync until the course was cached"""
+        return self.finished_at.get(course_id, 0.0)
+
+    def summary(self, names: dict[str, str] | None = None) -> list[str]:
+        names = names or {}
+        lines = []
+        for course_id in sorted(self.timings, key=self.course_time, reverse=True):
+            resources = ", ".join(
+                f"{resource} {seconds:.2f}s"
+                for resource, seconds in self.timings[course_id].items()
+            )
+            name = names.get(course_id, str(course_id))
+            lines.append(f"{name}: {self.course_time(course_id):.2f}s ({resources})")
+        return lines
+
+
+class SyncEngine:
+    """Fan out (course x resource) requests over a bounded worker pool"""
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max(1, max_workers)
+        self.jobs: list[SyncJob] = []
+
+    def add(
+        self,
+        course_id: str | list[str],
+        resource: str,
+        fetch: Callable[[], Any],
+        on_done: Callable[[Any], None],
+    ) -> None:
+        self.jobs.append(SyncJob(course_id, resource, fetch, on_done))
+
+    def run(self) -> SyncReport:
+        """Run every queued job, caching each result as soon as it arrives"""
+        report = SyncReport()
+        start = time.time()
+
+        def run_job(job: SyncJob) -> float:
+            job_start = time.time()
+            job.on_done(job.fetch())
+            return time.time() - job_start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(run_job, job): job for job in self.jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    Logger.info(
+                        f"Sync of {job.resource} for {job.course_id} failed: {e}"
+                    )
+                    report.fail(job)
+                    continue
+                report.record(job, seconds, time.time() - start)
+
+        self.jobs = []
+        report.elapsed = time.time() - start
+        return report
+
+
+class AsyncSyncEngine(SyncEngine):
+    """SyncEngine whose jobs return coroutines, all run on client's event loop.
+
+    The results are cached by a single writer thread rather than on the
+    loop: caching writes sqlite and the search index, and fetching goes on
+    meanwhile."""
+
+    def __init__(self, client: Any):
+        super().__init__()
+        self.client = client
+
+    def run(self) -> SyncReport:
+        report = self.client.run(self.run_jobs())
+        self.jobs = []
+        return report
+
+    async def run_jobs(self) -> SyncReport:
+        report = SyncReport()
+        start = time.time()
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=1) as writer:
+
+            async def run_job(job: SyncJob) -> None:
+                job_start = time.time()
+                try:
+                    result = await job.fetch()
+                    await loop.run_in_executor(writer, job.on_done, result)
+                except Exception as e:
+                    Logger.info(
+                        f"Sync of {job.resource} for {job.course_id} failed: {e}"
+                    )
+                    report.fail(job)
+                    return
+                now = time.time()
+                report.record(job, now - job_start, now - start)
+
+            await asyncio.gather(*(run_job(job) for job in self.jobs))
+        report.elapsed = time.time() - start
+        return report
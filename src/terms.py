@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import threading
+from typing import Any
+
+from helper import Logger, atomic_write
+from views import read_snapshot, write_snapshot
+
+
+def slug(term: str) -> str:
+    """File name safe form of a term name: "Fall 2024" becomes fall-2024"""
+    return re.sub(r"[^a-z0-9]+", "-", term.lower()).strip("-") or "term"
+
+
+class TermManifest:
+    """The terms cached under <cache_dir>/terms.
+
+    Every synced term keeps the snapshot of its rendered views there, so
+    switching to it needs neither the network nor the store. manifest.json
+    lists them with their number of courses and last sync. The snapshot of
+    the term synced last is kept as is for the fastest start, the others
+    are archived zlib compressed, as they're only read on a term switch."""
+
+    def __init__(self, cache_dir: str):
+        self.dir = os.path.join(cache_dir, "terms")
+        self.filename = os.path.join(self.dir, "manifest.json")
+        self.lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        self.terms: dict[str, dict[str, Any]] = self.read()
+
+    def read(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.filename) as file:
+                return json.loads(file.read())
+        except (OSError, ValueError):
+            return {}
+
+    def snapshot_file(self, term: str) -> str:
+        return os.path.join(self.dir, f"{slug(term)}.bin")
+
+    def available(self) -> list[tuple[str, dict[str, Any]]]:
+        """Cached terms and their manifest entries, most recently synced first"""
+        with self.lock:
+            terms = list(self.terms.items())
+        return sorted(terms, key=lambda term: term[1]["synced_at"], reverse=True)
+
+    def load(self, term: str) -> dict[str, Any] | None:
+        return read_snapshot(self.snapshot_file(term), term)
+
+    def save(self, snapshot: dict[str, Any]) -> None:
+        """Store the snapshot of the term that was just synced and archive
+        the ones of every other term"""
+        term = snapshot["term"]
+        write_snapshot(self.snapshot_file(term), snapshot)
+        with self.lock:
+            self.terms[term] = {
+                "courses": len(snapshot["ids"]),
+                "synced_at": snapshot["written_at"],
+                "compressed": False,
+            }
+            for other in [other for other in self.terms if other != term]:
+                if not self.terms[other]["compressed"]:
+                    self.archive(other)
+            atomic_write(self.filename, json.dumps(self.terms))
+
+    def archive(self, term: str) -> None:
+        snapshot = self.load(term)
+        if snapshot is None:
+            Logger.info(f"Dropping {term} from the term manifest, its snapshot is gone")
+            del self.terms[term]
+            return
+        write_snapshot(self.snapshot_file(term), snapshot, compressed=True)
+        self.terms[term]["compressed"] = True
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+import base64
+import hashlib
+import json
+import select
+import threading
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from http.client import (
+    HTTPConnection,
+    HTTPException,
+    HTTPMessage,
+    HTTPResponse,
+    HTTPSConnection,
+)
+from typing import Iterator
+from urllib.parse import urljoin, urlsplit
+
+from helper import Logger, atomic_write
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+ACCEPT_ENCODING = "gzip, deflate"
+
+HostKey = tuple[str, str, int]
+
+
+class RequestError(Exception):
+    """Raised when a request gets no usable response, after every retry or
+    because the cassette being replayed has none recorded"""
+
+
+class Response:
+    """A fully read response; the connection it came from is back in the pool"""
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        headers: HTTPMessage,
+        body: bytes,
+        wire_bytes: int | None = None,
+    ):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.wire_bytes = len(body) if wire_bytes is None else wire_bytes
+        self.retries = 0
+
+    def getcode(self) -> int:
+        return self.status
+
+    def getheader(self, name: str, default: str | None = None) -> str | None:
+        return self.headers.get(name, default)
+
+    def getheaders(self) -> list[tuple[str, str]]:
+        return self.headers.items()
+
+    def read(self) -> bytes:
+        return self.body
+
+
+class Cassette:
+    """Responses recorded per method and url, to replay a sync offline.
+
+    Bodies are stored decoded. While recording, validators are not sent so
+    every recorded response has a body, and on replay a matching
+    If-None-Match is answered with a 304 like Canvas would. Parameters that
+    change between runs are left out of the keys."""
+
+    SKIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+    # query parameters that change between runs, like the end_date of the
+    # announcements request which is always today
+    VOLATILE_PARAMS = ("end_date",)
+
+    def __init__(self, path: str, mode: str = "replay"):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.played: dict[str, int] = defaultdict(int)
+        try:
+            with open(path) as file:
+                self.entries: dict[str, list[dict]] = json.loads(file.read())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @classmethod
+    def key(cls, method: str, url: str, body: bytes | None = None) -> str:
+        parts = urlsplit(url)
+        query = "&".join(
+            param
+            for param in parts.query.split("&")
+            if param.split("=")[0] not in cls.VOLATILE_PARAMS
+        )
+        key = f"{method} {parts.path}?{query}"
+        if body:
+            key += " " + hashlib.sha1(body).hexdigest()
+        return key
+
+    def find(
+        self, method: str, url: str, body: bytes | None = None
+    ) -> tuple[int, list[tuple[str, str]], bytes] | None:
+        """Next recorded response for the request, the last one repeats"""
+        key = self.key(method, url, body)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            entry = entries[min(self.played[key], len(entries) - 1)]
+            self.played[key] += 1
+        if entry.get("base64"):
+            data = base64.b64decode(entry["body"])
+        else:
+            data = entry["body"].encode("utf-8")
+        return entry["status"], [tuple(header) for header in entry["headers"]], data
+
+    def play(
+        self, method: str, url: str, headers: dict[str, str], body: bytes | None = None
+    ) -> Response:
+        recorded = self.find(method, url, body)
+        if recorded is None:
+            # not a 404, which would read as Canvas having nothing to show
+            raise RequestError(f"Nothing recorded for {method} {url}")
+        message = HTTPMessage()
+        status, recorded_headers, data = recorded
+        for name, value in recorded_headers:
+            message[name] = value
+        etag = message.get("etag")
+        if etag and headers.get("If-None-Match") == etag:
+            return Response(url, 304, message, b"")
+        return Response(url, status, message, data)
+
+    @staticmethod
+    def strip_validators(headers: dict[str, str]) -> dict[str, str]:
+        return {
+            name: value
+            for name, value in headers.items()
+            if name not in ("If-None-Match", "If-Modified-Since")
+        }
+
+    def record(
+        self, method: str, url: str, body: bytes | None, response: Response
+    ) -> None:
+        try:
+            entry = {"body": response.body.decode("utf-8")}
+        except UnicodeDecodeError:
+            entry = {"body": base64.b64encode(response.body).decode(), "base64": True}
+        entry["status"] = response.status
+        entry["headers"] = [
+            [name, value]
+            for name, value in response.headers.items()
+            if name.lower() not in self.SKIPPED_HEADERS
+        ]
+        with self.lock:
+            self.entries.setdefault(self.key(method, url, body), []).append(entry)
+
+    def save(self) -> None:
+        if self.mode != "record":
+            return
+        with self.lock:
+            data = json.dumps(self.entries)
+        atomic_write(self.path, data)
+
+
+cassette: Cassette | None = None
+
+
+def set_cassette(path: str, mode: str) -> Cassette | None:
+    """Record every response to, or replay them from, the cassette at path"""
+    global cassette
+    cassette = Cassette(path, mode) if path else None
+    return cassette
+
+
+class TransferStats:
+    """Bytes received on the wire vs bytes handed to the json decoder"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def add(self, wire: int, decoded: int) -> None:
+        with self.lock:
+            self.wire_bytes += wire
+            self.decoded_bytes += decoded
+
+    def ratio(self) -> float:
+        with self.lock:
+            return self.decoded_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+
+class Decoder:
+    """Streaming decoder for the gzip and deflate content codings"""
+
+    def __init__(self, encoding: str | None):
+        self.encoding = (encoding or "identity").strip().lower()
+        self.decompressor = None
+        if self.encoding in ("gzip", "x-gzip"):
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        elif self.encoding == "deflate":
+            self.decompressor = zlib.decompressobj()
+        self.first_chunk = True
+
+    def decode(self, chunk: bytes) -> bytes:
+        if self.decompressor is None:
+            return chunk
+        if self.first_chunk and self.encoding == "deflate":
+            self.first_chunk = False
+            try:
+                return self.decompressor.decompress(chunk)
+            except zlib.error:
+                # some servers send raw deflate without the zlib wrapper
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        return self.decompressor.flush() if self.decompressor else b""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections shared across pages, endpoints and threads"""
+
+    def __init__(self, max_idle_per_host: int = 16, timeout: float = 30):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle: dict[HostKey, list[HTTPConnection]] = defaultdict(list)
+        self.connections_opened = 0
+        self.stats = TransferStats()
+
+    @staticmethod
+    def host_key(url: str) -> HostKey:
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname or "", port
+
+    @staticmethod
+    def is_healthy(conn: HTTPConnection) -> bool:
+        """An idle keep-alive socket should have nothing to read, a readable
+        one has been closed by the server (or holds junk) and is stale"""
+        if conn.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def connect(self, key: HostKey) -> HTTPConnection:
+        scheme, host, port = key
+        with self.lock:
+            self.connections_opened += 1
+        if scheme == "https":
+            return HTTPSConnection(host, port, timeout=self.timeout)
+        return HTTPConnection(host, port, timeout=self.timeout)
+
+    def acquire(self, key: HostKey) -> tuple[HTTPConnection, bool]:
+        """Return a healthy idle connection for key, or a new one.
+        The flag tells whether the connection has been used before"""
+        while True:
+            with self.lock:
+                conn = self.idle[key].pop() if self.idle[key] else None
+            if conn is None:
+                return self.connect(key), False
+            if self.is_healthy(conn):
+                return conn, True
+            conn.close()
+
+    def release(self, key: HostKey, conn: HTTPConnection) -> None:
+        with self.lock:
+            if len(self.idle[key]) < self.max_idle_per_host:
+                self.idle[key].append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, defaultdict(list)
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def send(
+        self,
+        key: HostKey,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None = None,
+    ) -> tuple[HTTPConnection, HTTPResponse]:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        while True:
+            conn, reused = self.acquire(key)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except (HTTPException, ConnectionError) as e:
+                conn.close()
+                if not reused:
+                    raise
+                # the server dropped a keep-alive connection between our health
+                # check and the request, retry on a fresh one
+                Logger.info(f"Reconnecting to {key[1]}: {e!r}")
+            except OSError:
+                conn.close()
+                raise
+
+    @contextmanager
+    def open(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+        method: str = "GET",
+        follow_redirects: bool = True,
+        body: bytes | None = None,
+    ) -> Iterator[HTTPResponse]:
+        """Send a request and yield the raw response. The connection goes back
+        to the pool once the body has been read, otherwise it is closed"""
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            key = self.host_key(url)
+            conn, response = self.send(key, method, url, headers, body)
+            location = response.getheader("location")
+            if not (
+                follow_redirects and response.status in REDIRECT_CODES and location
+            ):
+                break
+            response.read()
+            self.finish(key, conn, response)
+            next_url = urljoin(url, location)
+            if self.host_key(next_url) != key:
+                # don't leak the Canvas token to file storage hosts
+                headers.pop("Authorization", None)
+            if response.status == 303:
+                method, body = "GET", None
+            url = next_url
+        else:
+            # the last response was a redirect too, and its connection is
+            # already back in the pool
+            raise RequestError(f"Too many redirects for {url}")
+        response.url = url
+        try:
+            yield response
+        finally:
+            self.finish(key, conn, response)
+
+    def finish(self, key: HostKey, conn: HTTPConnection, response: HTTPResponse):
+        if response.isclosed() and not response.will_close:
+            self.release(key, conn)
+        else:
+            conn.close()
+
+    def request(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+        method: str = "GET",
+        body: bytes | None = None,
+    ) -> Response:
+        """Send a request with compression negotiated and return the decoded body"""
+        headers = dict(headers or {})
+        if cassette and cassette.mode == "replay":
+            return cassette.play(method, url, headers, body)
+        if cassette:
+            headers = cassette.strip_validators(headers)
+        headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+        with self.open(url, headers, method, body=body) as response:
+            decoder = Decoder(response.getheader("content-encoding"))
+            wire = 0
+            chunks = []
+            while chunk := response.read(CHUNK_SIZE):
+                wire += len(chunk)
+                chunks.append(decoder.decode(chunk))
+            chunks.append(decoder.flush())
+            decoded = b"".join(chunks)
+            self.stats.add(wire, len(decoded))
+            result = Response(
+                response.url, response.status, response.msg, decoded, wire
+            )
+        if cassette:
+            cassette.record(method, url, body, result)
+        return result
+
+
+pool = ConnectionPool()
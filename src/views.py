@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+import marshal
+import struct
+import time
+import zlib
+from typing import Any
+
+from convas_requests import (
+    get_current_course_id,
+    get_current_course_names,
+    get_discussions,
+)
+from helper import Logger, atomic_write
+from html_text import html_to_text
+from store import RESOURCES, CacheStore
+
+# columns of each resource that the course tabs display
+TAB_COLUMNS = {
+    "assignments": [
+        "id",
+        "name",
+        "html_url",
+        "points_possible",
+        "created_at",
+        "submission",
+    ],
+    "announcements": ["id", "title", "message", "user_name", "created_at"],
+    "quizzes": ["id", "title", "html_url", "due_at"],
+    "files": ["id", "display_name", "mime_class", "size", "url", "updated_at"],
+}
+# html columns the tabs show as text, converted before they're drawn
+TEXT_COLUMNS = {"announcements": ["message"]}
+
+SNAPSHOT_MAGIC = b"CNVS"
+SNAPSHOT_VERSION = 1
+# magic, snapshot version, marshal version, zlib compressed payload, crc32 of
+# the payload as stored
+SNAPSHOT_HEADER = struct.Struct("<4sHH?I")
+
+
+def dashboard_rows(
+    course: dict[str, Any],
+    announcement: dict[str, Any] | None,
+    assignments: list[dict[str, Any]] | None,
+) -> dict[str, Any]:
+    """The text of every panel of the dashboard of course"""
+    title = ""
+    msg = ""
+    date = ""
+    if announcement:
+        msg = html_to_text(announcement["message"])
+        title = announcement["title"]
+        date = announcement["created_at"][:10]
+
+    upcoming_assignments = [""]
+    completed_assignments = [""]
+    if assignments:
+        completed_assignments = [
+            assignment["name"]
+            for assignment in assignments
+            if "submission" not in assignment.keys()
+        ]
+        upcoming_assignments = [
+            assignment["name"]
+            for assignment in assignments
+            if ("submission" in assignment.keys())
+            and assignment["submission"]["submitted_at"] != 0
+        ]
+
+    # courses without a teacher or a student enrollment show empty text
+    teachers = course.get("teachers") or [{}]
+    score = next(
+        (
+            enrollment.get("computed_current_score")
+            for enrollment in course.get("enrollments") or []
+            if enrollment.get("type") == "student"
+        ),
+        None,
+    )
+    start = (course.get("term") or {}).get("start_at") or ""
+    return {
+        "heading": course["name"],
+        "syllabus": html_to_text(course["syllabus_body"]),
+        "announcement": [
+            "Latest Announcement\n",
+            (f"Title: { title }") if title != "" else "No announcements",
+            (f"Date: {date}") if len(date) else "",
+            msg,
+        ],
+        "upcoming": ["Upcoming assignments", " "]
+        + (
+            upcoming_assignments
+            if upcoming_assignments
+            else ["No upcoming assignments"]
+        ),
+        "completed": ["Completed assignments", " "]
+        + (
+            completed_assignments
+            if completed_assignments
+            else ["No completed assignments"]
+        ),
+        "info": [
+            f"Started at: { start[:10] }",
+            f"Instructor: { teachers[0].get('display_name') or '' }",
+            f"Score: { '' if score is None else score }",
+            f"Course ID: {course['id']}",
+        ],
+    }
+
+
+class TabModel:
+    """The rows of a course tab as the main window draws them: the left
+    and right column text of every row, rows_per_item lines each, and the
+    column each line of the right side starts at. The first header rows
+    are column headings rather than items"""
+
+    def __init__(
+        self,
+        left: list[list[str]] | list[str],
+        right: list[list[str]] | None = None,
+        offsets: list[list[int]] | None = None,
+        rows_per_item: int = 1,
+        header: int = 0,
+    ):
+        self.left = left
+        self.right = right
+        self.offsets = offsets
+        self.rows_per_item = rows_per_item
+        self.header = header
+
+
+def assignments_model(assignments: list[dict[str, Any]], cols: int) -> TabModel:
+    left = [["Assignment Name", ""]] + [
+        (
+            [assignment["name"], ""]
+            if len(assignment["name"]) < 30
+            else [assignment["name"][:30] + "...", ""]
+        )
+        for assignment in assignments
+    ]
+    right = [["Points   Created at", ""]]
+    for assignment in assignments:
+        if ("submission" in assignment.keys()) and assignment["submission"][
+            "submitted_at"
+        ] != 0:
+            points = (
+                f"{assignment['submission']['score']}/{assignment['points_possible']}"
+            )
+        else:
+            points = f"{assignment['points_possible']}"
+        right.append([f"{points}   {assignment['created_at'][:10]}", ""])
+    offsets = [[(cols - len(str(row[0])) - 3), 0] for row in right]
+    return TabModel(left, right, offsets, 2, header=1)
+
+
+def announcements_model(announcements: list[dict[str, Any]], cols: int) -> TabModel:
+    left = [
+        [announcement["user_name"], announcement["title"], ""]
+        for announcement in announcements
+    ]
+    right = [
+        [announcement["created_at"][:10], "", ""] for announcement in announcements
+    ]
+    offsets = [[(cols - len(str(row)) - 3), 0, 0] for row in right]
+    return TabModel(left, right, offsets, 3)
+
+
+def discussions_model(assignments: list[dict[str, Any]], cols: int) -> TabModel:
+    return TabModel([assignment["name"] for assignment in get_discussions(assignments)])
+
+
+def grades_model(assignments: list[dict[str, Any]], cols: int) -> TabModel:
+    left = [
+        [assignment["name"], assignment["submission"]["submitted_at"][:10], ""]
+        for assignment in assignments
+        if ("submission" in assignment.keys())
+        and assignment["submission"]["submitted_at"] != 0
+    ]
+    right = [
+        [
+            f"{assignment['points_possible']}/ {assignment['submission']['score']}",
+            "",
+            "",
+        ]
+        for assignment in assignments
+        if ("submission" in assignment.keys())
+        and assignment["submission"]["submitted_at"] != -1
+    ]
+    offsets = [[(cols - len(str(row)) - 3), 0, 0] for row in right]
+    return TabModel(left, right, offsets, 3)
+
+
+def quizzes_model(quizzes: list[dict[str, Any]], cols: int) -> TabModel:
+    left = [["Quiz name", ""]] + [[quiz["title"][0:30], ""] for quiz in quizzes]
+    right = [["Date created", ""]] + [
+        [f"{quiz['due_at'][:10]}", ""] for quiz in quizzes
+    ]
+    offsets = [[(cols - len(str(row)) - 3), 0] for row in right]
+    return TabModel(left, right, offsets, 2, header=1)
+
+
+def files_model(files: list[dict[str, Any]], cols: int) -> TabModel:
+    left = [["Filename", ""]] + [[file["display_name"][:30], ""] for file in files]
+    right = [["filetype  " + "created_at", ""]] + [
+        [f"{file['mime_class']}  {file['updated_at'][:10]} ", ""] for file in files
+    ]
+    offsets = [[(cols - len(str(row[0])) - 3), 0] for row in right]
+    return TabModel(left, right, offsets, 2, header=1)
+
+
+# tab name -> the resource its rows come from and the builder of its model
+TAB_MODELS = {
+    "assignments": ("assignments", assignments_model),
+    "announcements": ("announcements", announcements_model),
+    "discussions": ("assignments", discussions_model),
+    "grades": ("assignments", grades_model),
+    "quizzes": ("quizzes", quizzes_model),
+    "files": ("files", files_model),
+}
+
+
+def as_text(
+    resource: str, items: list[dict[str, Any]] | None
+) -> list[dict[str, Any]] | None:
+    """Items with their TEXT_COLUMNS converted from html to text"""
+    columns = TEXT_COLUMNS.get(resource)
+    if items is None or not columns:
+        return items
+    return [
+        {**item, **{column: html_to_text(item.get(column)) for column in columns}}
+        for item in items
+    ]
+
+
+def pack(resource: str, items: list[dict[str, Any]] | None) -> list[tuple] | None:
+    """Items as tuples in TAB_COLUMNS order, rather than a dict of keys per row"""
+    if items is None:
+        return None
+    return [
+        tuple(item.get(column) for column in TAB_COLUMNS[resource]) for item in items
+    ]
+
+
+def unpack(resource: str, rows: list[tuple] | None) -> list[dict[str, Any]] | None:
+    if rows is None:
+        return None
+    columns = TAB_COLUMNS[resource]
+    # a missing submission stays missing, like in the store
+    return [
+        {
+            column: value
+            for column, value in zip(columns, row)
+            if value is not None or column != "submission"
+        }
+        for row in rows
+    ]
+
+
+def build_snapshot(
+    store: CacheStore, courses: list[dict[str, Any]], term: str
+) -> dict[str, Any]:
+    """Everything the status bar, dashboards and tabs of term render"""
+    course_ids = get_current_course_id(courses, term)
+    views = {}
+    for course in courses:
+        if course["id"] not in course_ids:
+            continue
+        tabs = {
+            resource: store.items(resource, course["id"], TAB_COLUMNS[resource])
+            for resource in RESOURCES
+        }
+        latest = tabs["announcements"][0] if tabs["announcements"] else None
+        views[course["id"]] = {
+            "tabs": {
+                resource: pack(resource, as_text(resource, items))
+                for resource, items in tabs.items()
+            },
+            "dashboard": dashboard_rows(course, latest, tabs["assignments"]),
+        }
+    return {
+        "term": term,
+        "written_at": time.time(),
+        "courses": [course for course in courses if course["id"] in course_ids],
+        "names": get_current_course_names(courses, term),
+        "ids": course_ids,
+        "views": views,
+    }
+
+
+def write_snapshot(
+    filename: str, snapshot: dict[str, Any], compressed: bool = False
+) -> None:
+    """Write snapshot to filename, compressed for terms that are rarely read"""
+    payload = marshal.dumps(snapshot)
+    if compressed:
+        payload = zlib.compress(payload, 9)
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        marshal.version,
+        compressed,
+        zlib.crc32(payload),
+    )
+    atomic_write(filename, header + payload)
+
+
+def read_snapshot(filename: str, term: str) -> dict[str, Any] | None:
+    """The snapshot of term in filename, None if it is missing, was written
+    by another version or for another term, or doesn't match its checksum"""
+    try:
+        with open(filename, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if len(data) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, marshal_version, compressed, crc = SNAPSHOT_HEADER.unpack_from(data)
+    payload = memoryview(data)[SNAPSHOT_HEADER.size :]
+    if (magic, version, marshal_version) != (
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        marshal.version,
+    ):
+        return None
+    if zlib.crc32(payload) != crc:
+        Logger.info(f"Ignoring corrupt snapshot {filename}")
+        return None
+    try:
+        snapshot = marshal.loads(zlib.decompress(payload) if compressed else payload)
+    except (EOFError, ValueError, TypeError, zlib.error):
+        return None
+    return snapshot if snapshot.get("term") == term else None
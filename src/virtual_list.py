@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import curses
+from typing import Any
+
+from layout import clip
+from views import TabModel
+
+
+def ctrl(key: str) -> int:
+    return ord(key) & 0x1F
+
+
+class VirtualList:
+    """The rows of a TabModel in a bordered window, with a cursor on one item.
+
+    The header rows of the model stay at the top and the items scroll under
+    them, rows_per_item lines each. Only visible items are drawn: moving the
+    cursor within the page redraws the item it leaves and the one it enters,
+    scrolling redraws the page, so a step costs the same whatever the length
+    of the list."""
+
+    def __init__(self, win: Any, model: TabModel, cursor: bool = True):
+        self.win = win
+        self.model = model
+        self.show_cursor = cursor
+        self.count = len(model.left) - model.header
+        self.top = 0  # first visible item
+        self.cursor = 0
+        rows, self.cols = win.getmaxyx()
+        lines = rows - 2 - model.header * model.rows_per_item
+        self.page = max(lines // model.rows_per_item, 1)
+
+    @property
+    def selected(self) -> int | None:
+        """Index of the item under the cursor, None if there are no items"""
+        return self.cursor if self.count else None
+
+    def place(self, cursor: int, top: int) -> None:
+        """Put the cursor and the first visible item back where they were,
+        as far as the list still allows, without drawing"""
+        if not self.count:
+            return
+        self.cursor = min(max(cursor, 0), self.count - 1)
+        top = min(top, self.cursor, self.count - self.page)
+        self.top = max(top, self.cursor - self.page + 1, 0)
+
+    def handle(self, key: int) -> bool:
+        """Move the cursor for a navigation key, returns whether key was one"""
+        half = max(self.page // 2, 1)
+        scrolls = {
+            ctrl("d"): half,
+            ctrl("u"): -half,
+            ctrl("f"): self.page,
+            ctrl("b"): -self.page,
+            curses.KEY_NPAGE: self.page,
+            curses.KEY_PPAGE: -self.page,
+        }
+        if key in (ord("j"), curses.KEY_DOWN):
+            self.move(self.cursor + 1)
+        elif key in (ord("k"), curses.KEY_UP):
+            self.move(self.cursor - 1)
+        elif key in scrolls:
+            self.scroll(scrolls[key])
+        elif key in (ord("g"), curses.KEY_HOME):
+            self.move(0)
+        elif key in (ord("G"), curses.KEY_END):
+            self.move(self.count - 1)
+        else:
+            return False
+        return True
+
+    def scroll(self, n: int) -> None:
+        """Scroll the page and the cursor by n items, keeping the cursor on
+        the same screen row when the list allows it"""
+        top = min(max(self.top + n, 0), max(self.count - self.page, 0))
+        self.move(self.cursor + n, top)
+
+    def move(self, index: int, top: int | None = None) -> None:
+        """Put the cursor on item index, scrolling just enough to show it"""
+        if not self.count:
+            return
+        index = min(max(index, 0), self.count - 1)
+        top = self.top if top is None else top
+        top = min(max(top, index - self.page + 1), index)
+        previous, self.cursor = self.cursor, index
+        if top != self.top:
+            self.top = top
+            self.draw()
+            return
+        self.draw_item(previous)
+        self.draw_item(index)
+        self.win.refresh()
+
+    def draw(self) -> None:
+        self.win.erase()
+        self.win.border()
+        for row in range(self.model.header):
+            self.draw_row(row, row, curses.A_NORMAL)
+        for index in range(self.top, min(self.top + self.page, self.count)):
+            self.draw_item(index)
+        self.win.refresh()
+
+    def draw_item(self, index: int) -> None:
+        if not self.top <= index < self.top + self.page:
+            return
+        selected = self.show_cursor and index == self.cursor
+        self.draw_row(
+            self.model.header + index,
+            self.model.header + index - self.top,
+            curses.A_REVERSE if selected else curses.A_NORMAL,
+        )
+
+    def draw_row(self, row: int, slot: int, mode: int) -> None:
+        """Draw row of the model at the slot-th position of the window"""
+        model = self.model
+        left = model.left[row]
+        right = model.right[row] if model.right and row < len(model.right) else None
+        for i, line in enumerate([left] if isinstance(left, str) else left):
+            y = 1 + slot * model.rows_per_item + i
+            if line == "":
+                self.win.hline(y, 1, curses.ACS_HLINE, self.cols - 2)
+            else:
+                self.win.addstr(y, 1, clip(line, self.cols - 2), mode)
+            if not right:
+                continue
+            text = right if isinstance(right, str) else right[i]
+            offset = model.offsets[row] if model.offsets else 1
+            offset = max(offset if isinstance(offset, int) else offset[i], 1)
+            if text:
+                self.win.addstr(y, offset, clip(text, self.cols - 1 - offset), mode)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+"""Plain text of the html of syllabi and announcements"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from html_text import html_to_text  # noqa: E402
+
+
+class HtmlTextTest(unittest.TestCase):
+    def test_paragraphs(self):
+        self.assertEqual(
+            html_to_text("<p> Read  <b>chapter 2</b> </p><p>Quiz friday</p>"),
+            "Read chapter 2\n\nQuiz friday",
+        )
+
+    def test_leading_pre_keeps_indentation(self):
+        self.assertEqual(
+            html_to_text("<pre>    def f():\n        return 1\n</pre><p>Run it</p>"),
+            "    def f():\n        return 1\n\nRun it",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
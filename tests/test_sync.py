@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+"""Offline syncs of convas against the fake Canvas server"""
+
+import importlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.client import IncompleteRead, RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+RESOURCES = ("assignments", "announcements", "files", "quizzes")
+TERM = "Fake Term"
+
+# imported by setUpModule
+convas: Any = None
+fake_canvas: Any = None
+scheduler: Any = None
+store: Any = None
+transport: Any = None
+
+home: Any = None
+environ: Any = None
+cwd = ""
+
+
+def setUpModule():
+    """convas reads ~/.config/convas/config when imported and its modules log
+    to ./log, so both point into a temporary home while the tests run"""
+    global convas, fake_canvas, scheduler, store, transport, home, environ, cwd
+    home = tempfile.TemporaryDirectory()
+    environ = mock.patch.dict(os.environ, {"HOME": home.name})
+    environ.start()
+    cwd = os.getcwd()
+    os.chdir(home.name)
+    os.makedirs(f"{home.name}/.config/convas")
+    with open(f"{home.name}/.config/convas/config", "w") as file:
+        file.write(f"TOKEN=fake\ndomain=http://127.0.0.1:0/\nterm={TERM}\n")
+    convas = importlib.import_module("convas")
+    fake_canvas = importlib.import_module("fake_canvas")
+    scheduler = importlib.import_module("scheduler")
+    store = importlib.import_module("store")
+    transport = importlib.import_module("transport")
+
+
+def tearDownModule():
+    os.chdir(cwd)
+    environ.stop()
+    home.cleanup()
+
+
+class Tomorrow(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + timedelta(days=1)
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.canvas = fake_canvas.FakeCanvas(
+            courses=3, assignments=25, files=30, quizzes=5, announcements=12
+        )
+        self.cache_dir = tempfile.TemporaryDirectory()
+        # the scheduler is shared by every sync of the process
+        shared = scheduler.scheduler
+        shared.limit = float(shared.max_concurrency)
+        shared.remaining = shared.cost = None
+        shared.throttled = shared.retries = 0
+        shared.rtt, shared.decreased_at = 0.0, float("-inf")
+        shared.base_delay = 0.05
+
+    def tearDown(self):
+        convas.cassette = transport.set_cassette("", "replay")
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def serve(self, **options) -> Any:
+        self.server = fake_canvas.FakeCanvasServer(
+            ("127.0.0.1", 0), self.canvas, **options
+        )
+        self.server.start()
+        port = self.server.server_address[1]
+        convas.config.map["domain"] = f"http://127.0.0.1:{port}/"
+        return self.server
+
+    def syncer(self, name: str = "cache", backend: str = "thread"):
+        cache_dir = os.path.join(self.cache_dir.name, name)
+        os.makedirs(cache_dir, exist_ok=True)
+        return convas.CacheSync(cache_dir + "/", TERM, backend)
+
+    def sync(self, syncer, delta: bool = False, failed: list | None = None):
+        report = syncer.make_api_calls(True, True, True, True, True, delta=delta)
+        self.assertEqual(sorted(report.failed), sorted(failed or []))
+
+    def cached(self, syncer) -> dict[tuple[str, int], list]:
+        return {
+            (resource, course["id"]): syncer.store.items(resource, course["id"])
+            for course in syncer.store.courses()
+            for resource in RESOURCES
+        }
+
+    def assert_synced(self, syncer) -> None:
+        self.assertEqual(
+            [course["id"] for course in syncer.store.courses()],
+            [course["id"] for course in self.canvas.courses],
+        )
+        for (resource, course_id), items in self.cached(syncer).items():
+            self.assertEqual(
+                sorted(item["id"] for item in items),
+                sorted(
+                    item["id"] for item in self.canvas.resources[resource, course_id]
+                ),
+                f"{resource} of {course_id}",
+            )
+
+    def test_full_sync(self):
+        self.serve()
+        syncer = self.syncer()
+        self.sync(syncer)
+        self.assert_synced(syncer)
+        self.assertEqual(self.server.not_modified, 0)
+        # everything is in the store, nothing in per course json files
+        files = os.listdir(syncer.cache_dir)
+        self.assertEqual(
+            [name for name in files if name.endswith((".json", ".validators"))],
+            ["sync_state.json"],
+        )
+        self.assertIn("trace.jsonl", files)
+
+    def test_async_sync(self):
+        self.serve()
+        syncer = self.syncer(backend="async")
+        self.sync(syncer)
+        self.assert_synced(syncer)
+        cached = self.cached(syncer)
+        self.sync(syncer)
+        self.assertGreater(self.server.not_modified, 0)
+        self.assertEqual(self.cached(syncer), cached)
+
+    def test_course_without_teacher(self):
+        self.serve()
+        course = self.canvas.courses[-1]
+        course["teachers"] = []
+        course["enrollments"] = [{"type": "observer"}]
+        syncer = self.syncer()
+        self.sync(syncer)
+        rows = syncer.terms.load(TERM)["views"][course["id"]]["dashboard"]
+        self.assertIn("Instructor: ", rows["info"])
+        self.assertIn("Score: ", rows["info"])
+
+    def test_unchanged_sync(self):
+        self.serve()
+        syncer = self.syncer()
+        self.sync(syncer)
+        cached = self.cached(syncer)
+        requests = self.server.requests
+        self.sync(syncer)
+        # every page comes back 304 from the stored validators
+        self.assertGreater(self.server.not_modified, 0)
+        self.assertEqual(self.server.not_modified, self.server.requests - requests)
+        self.assertEqual(self.cached(syncer), cached)
+
+    def test_delta_sync(self):
+        self.serve()
+        syncer = self.syncer()
+        self.sync(syncer)
+        course_id = self.canvas.courses[0]["id"]
+        added = {**self.canvas.resources["files", course_id][-1]}
+        added.update(id=added["id"] + 1, updated_at="2030-01-01T00:00:00Z")
+        self.canvas.resources["files", course_id].append(added)
+        self.sync(syncer, delta=True)
+        self.assert_synced(syncer)
+        self.assertIn(
+            added["id"], [file["id"] for file in syncer.store.items("files", course_id)]
+        )
+
+    def test_delta_sync_keeps_newest_first(self):
+        self.serve()
+        syncer = self.syncer()
+        self.sync(syncer)
+        course_id = self.canvas.courses[0]["id"]
+        announcements = self.canvas.resources["announcements", course_id]
+        added = {**announcements[0]}
+        added.update(
+            id=added["id"] + 1,
+            title="Exam moved",
+            created_at=Tomorrow.now().isoformat(),
+        )
+        announcements.insert(0, added)
+        self.sync(syncer, delta=True)
+        self.assertEqual(
+            [item["id"] for item in syncer.store.items("announcements", course_id)],
+            [item["id"] for item in announcements],
+        )
+        rows = syncer.terms.load(TERM)["views"][course_id]["dashboard"]
+        self.assertIn("Exam moved", str(rows))
+
+    def test_throttled_sync(self):
+        # a bucket much smaller than a sync, refilled quickly enough to retry
+        self.serve(rate_limit=fake_canvas.RateLimit(capacity=10, refill=100, cost=1))
+        syncer = self.syncer()
+        self.sync(syncer)
+        self.assert_synced(syncer)
+        self.assertGreater(self.server.throttled, 0)
+        budget = scheduler.scheduler.budget()
+        self.assertGreater(budget["throttled"], 0)
+        self.assertLess(budget["limit"], scheduler.scheduler.max_concurrency)
+
+    def test_expired_token(self):
+        self.serve()
+        syncer = self.syncer()
+        self.sync(syncer)
+        cached = self.cached(syncer)
+        # a 401 fails every job instead of emptying the cache
+        self.server.token = "renewed"
+        self.sync(
+            syncer,
+            failed=[
+                (course["id"], resource)
+                for course in self.canvas.courses
+                for resource in RESOURCES
+            ],
+        )
+        self.assertEqual(self.cached(syncer), cached)
+
+    def record(self) -> str:
+        """Path of a cassette recorded from a full sync"""
+        path = os.path.join(self.cache_dir.name, "canvas.cassette")
+        convas.cassette = transport.set_cassette(path, "record")
+        self.sync(self.syncer("recorded"))
+        # replays go nowhere near the server
+        self.server.shutdown()
+        return path
+
+    def test_replay(self):
+        self.serve()
+        path = self.record()
+        convas.cassette = transport.set_cassette(path, "replay")
+        syncer = self.syncer()
+        self.sync(syncer)
+        self.assert_synced(syncer)
+
+    def test_replay_another_day(self):
+        self.serve()
+        path = self.record()
+        convas.cassette = transport.set_cassette(path, "replay")
+        syncer = self.syncer()
+        with mock.patch("convas_requests.datetime", Tomorrow):
+            self.sync(syncer)
+        self.assert_synced(syncer)
+
+    def test_replay_missing_recording(self):
+        self.serve()
+        path = self.record()
+        convas.cassette = transport.set_cassette(path, "replay")
+        syncer = self.syncer()
+        self.sync(syncer)
+        cached = self.cached(syncer)
+        course_id = self.canvas.courses[0]["id"]
+        convas.cassette.entries = {
+            key: entries
+            for key, entries in convas.cassette.entries.items()
+            if f"/courses/{course_id}/quizzes" not in key
+        }
+        # the missing recording fails the job and keeps the cached quizzes
+        self.sync(syncer, failed=[(course_id, "quizzes")])
+        self.assertEqual(self.cached(syncer), cached)
+
+
+class StoreTest(unittest.TestCase):
+    def test_import_json_cache(self):
+        canvas = fake_canvas.FakeCanvas(courses=2, assignments=3)
+        course_id = canvas.courses[0]["id"]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # the cache files of the releases before the store
+            files = {
+                "courses.json": canvas.courses,
+                f"assignments{course_id}.json": canvas.resources[
+                    "assignments", course_id
+                ],
+            }
+            for name, items in files.items():
+                with open(os.path.join(cache_dir, name), "w") as file:
+                    json.dump(items, file)
+            cache = store.CacheStore(cache_dir)
+            self.assertEqual(len(cache.courses()), 2)
+            self.assertEqual(
+                [item["name"] for item in cache.items("assignments", course_id)],
+                [item["name"] for item in canvas.resources["assignments", course_id]],
+            )
+            self.assertFalse(
+                [name for name in os.listdir(cache_dir) if name.endswith(".json")]
+            )
+            cache.close()
+
+
+class Redirect(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(302)
+        self.send_header("Location", "/again")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TransportTest(unittest.TestCase):
+    def test_redirect_loop(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Redirect)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        pool = transport.ConnectionPool()
+        try:
+            with self.assertRaises(transport.RequestError):
+                pool.request(f"http://127.0.0.1:{server.server_address[1]}/")
+            # every connection went back to the pool once
+            idle = [conn for conns in pool.idle.values() for conn in conns]
+            self.assertEqual(len(idle), len(set(map(id, idle))))
+        finally:
+            pool.close()
+            server.shutdown()
+            server.server_close()
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.RateLimitScheduler(max_retries=2, base_delay=0)
+
+    def test_transient_errors(self):
+        errors = [IncompleteRead(b""), RemoteDisconnected("closed"), socket.gaierror()]
+
+        def send():
+            raise errors.pop()
+
+        with self.assertRaises(scheduler.RequestError):
+            self.scheduler.request(send)
+        self.assertEqual(self.scheduler.retries, 2)
+        self.assertEqual(self.scheduler.in_flight, 0)
+
+    def test_decrease_once_per_round_trip(self):
+        self.scheduler.note_rtt(60)
+        for _ in range(5):
+            self.scheduler.decrease()
+        self.assertEqual(self.scheduler.limit, self.scheduler.max_concurrency / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()